@@ -1,105 +1,253 @@
 import wx
 import wx.grid
 import wx.grid as gridlib
-import yt_dlp
 import threading
 import os
+import io
+import time
+import logging
+from collections import OrderedDict, deque
+from logging.handlers import RotatingFileHandler
 from urllib.parse import urlparse, parse_qs
-import subprocess
-
-
-class MediaEntry:
-    def __init__(self, url: str, title: str, file_path: str, is_playlist: bool):
-        self.url = url
-        self.title = title
-        self.file_path = file_path
-        self.is_playlist = is_playlist
-
-    def __repr__(self):
-        return (f"MediaEntry(title='{self.title}', url='{self.url}', "
-                f"path='{self.file_path}', playlist={self.is_playlist})")
-    def __str__(self):
-        return f"{self.title}|{self.url}|{self.file_path}|{int(self.is_playlist)}"
-    def to_csv_line(self):
-        # Escape commas if needed
-        return f"{self.title},{self.url},{self.file_path},{int(self.is_playlist)}"
-    @staticmethod
-    def from_csv_line(line: str):
-        parts = line.strip().split(",")
-        if len(parts) == 4:
-            title, url, file_path, is_playlist = parts
-            return MediaEntry(url, title, file_path, bool(int(is_playlist)))
-        return None
-    @staticmethod
-    def from_string(line: str):
-        parts = line.strip().split("|")
-        if len(parts) == 4:
-            title, url, file_path, is_playlist = parts
-            return MediaEntry(url, title, file_path, bool(int(is_playlist)))
-        return None
 
-class MediaLibrary:
-    def __init__(self):
-        self.entries = []
+from download_engine import (DownloadEngine, JobJournal, MediaEntry, MediaLibrary, ProgressTable, SharedJobQueue,
+                             format_percent, format_speed, seconds_to_time, video_records, watch_url)
+
+
+class LogBuffer:
+    """
+    Bounded log of the last max_lines lines with severity levels. Any thread
+    can append; the UI flushes the lines added since the last flush in one go
+    on its timer. With a log_file every line is also written there, rotated
+    by size, so the full history survives the cap.
+    """
+    DEBUG, INFO, WARNING, ERROR = logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR
 
-    def add_entry(self, url: str, title: str, file_path: str, is_playlist: bool):
-        if url in [e.url for e in self.entries]:
-            wx.MessageBox("This URL already exists in the library.", "Duplicate Entry", wx.OK | wx.ICON_WARNING)    
-            return  # Avoid duplicates
+    def __init__(self, max_lines: int = 2000, log_file: str = None):
+        self.lines = deque(maxlen=max_lines)  # (level, text)
+        self._pending = deque(maxlen=max_lines)
+        self._dropped = False  # more lines than max_lines arrived since the last flush
+        self._lock = threading.Lock()
+        self.logger = None
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self.logger = logging.getLogger(f"youtube_downloader.{id(self)}")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.DEBUG)
+            self.logger.addHandler(handler)
+
+    def append(self, message, level: int = logging.INFO):
+        if isinstance(message, dict):
+            text = "\n".join(f"  {key}: {value}" for key, value in message.items())
+        elif isinstance(message, (list, set, tuple)):
+            text = "\n".join(f"  - {item}" for item in message)
         else:
-            entry = MediaEntry(url, title, file_path, is_playlist)
-            self.entries.append(entry)
+            text = str(message)
+        stamp = time.strftime("%H:%M:%S")
+        name = logging.getLevelName(level)
+        with self._lock:
+            for n, line in enumerate(text.splitlines() or [""]):
+                line = f"{stamp} {name:<7} {line}" if n == 0 else f"{'':17}{line}"
+                self._dropped = self._dropped or len(self._pending) == self._pending.maxlen
+                self.lines.append((level, line))
+                self._pending.append((level, line))
+        if self.logger is not None:
+            self.logger.log(level, text)
+
+    def drain(self):
+        """Return (new_lines, rebuild): rebuild is True when new_lines alone (the last max_lines) should replace the view."""
+        with self._lock:
+            rebuild = self._dropped
+            pending = list(self._pending)
+            self._pending.clear()
+            self._dropped = False
+        return pending, rebuild
+
+    def clear(self):
+        with self._lock:
+            self.lines.clear()
+            self._pending.clear()
+            self._dropped = False
+
+
+class ThumbnailLoader:
+    """
+    Loads thumbnails off the UI thread. Worker threads take requests newest
+    first (the row just selected beats older prefetches), read them through
+    the engine's ThumbnailCache and decode and scale them with wx.Image; the
+    UI thread only turns the result into a wx.Bitmap and keeps the last
+    memory_size of those in an LRU. on_ready(video_id, bitmap) runs on the UI
+    thread when a requested thumbnail arrives.
+    """
+    def __init__(self, cache, on_ready, size=(320, 180), memory_size: int = 200, workers: int = 4, backlog: int = 32):
+        self.cache = cache
+        self.on_ready = on_ready
+        self.size = size
+        self.memory_size = memory_size
+        self.backlog = backlog
+        self.bitmaps = OrderedDict()  # video id -> scaled wx.Bitmap, UI thread only
+        self._requests = deque()  # videos waiting for a worker, newest on the right
+        self._pending = set()  # ids queued or being loaded
+        self._cond = threading.Condition()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def get(self, video_id):
+        bitmap = self.bitmaps.get(video_id)
+        if bitmap is not None:
+            self.bitmaps.move_to_end(video_id)
+        return bitmap
+
+    def request(self, videos):
+        """Queue videos not in memory yet; the last one is loaded first."""
+        with self._cond:
+            for video in videos:
+                if not video or not video.get('id') or video['id'] in self.bitmaps:
+                    continue
+                if video['id'] in self._pending:
+                    # move it to the front of the line
+                    self._requests = deque(v for v in self._requests if v['id'] != video['id'])
+                self._requests.append(video)
+                self._pending.add(video['id'])
+            while len(self._requests) > self.backlog:
+                self._pending.discard(self._requests.popleft()['id'])  # rows long scrolled past
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._requests:
+                    self._cond.wait()
+                video = self._requests.pop()
+            try:
+                image = wx.Image(io.BytesIO(self.cache.load(video)))
+                image = image.Scale(*self.size, wx.IMAGE_QUALITY_HIGH) if image.IsOk() else None
+            except Exception:
+                image = None
+            wx.CallAfter(self._ready, video['id'], image)
+
+    def _ready(self, video_id, image):
+        with self._cond:
+            self._pending.discard(video_id)
+        if image is None:
+            return
+        self.bitmaps[video_id] = wx.Bitmap(image)
+        while len(self.bitmaps) > self.memory_size:
+            self.bitmaps.popitem(last=False)
+        self.on_ready(video_id, self.bitmaps[video_id])
+
+
+class VideoGridTable(gridlib.GridTableBase):
+    """
+    Virtual table over the fetched video list. Cells are produced on demand
+    when the grid paints them: the checkbox column reads the selected_rows set
+    and the progress columns read the shared ProgressTable, so loading a
+    playlist costs one row-count message instead of a SetCellValue per cell.
+    """
+    COLUMNS = ["✔", "Title", "ID", "%", "Speed", "Left time"]
+    PLACEHOLDERS = {3: "__________", 4: "__________", 5: "______________"}
+    PROGRESS_KEYS = {3: 'percent', 4: 'speed', 5: 'eta'}
+
+    def __init__(self, selected_rows: set, progress: ProgressTable):
+        super().__init__()
+        self.videos = []
+        self.rows = 0  # rows the grid has been told about; videos may grow in place
+        self.selected_rows = selected_rows
+        self.progress = progress
+        self.done_attr = gridlib.GridCellAttr()
+        self.done_attr.SetBackgroundColour(wx.Colour(144, 238, 144))  # light green
+
+    def set_videos(self, videos: list):
+        old, new = self.rows, len(videos)
+        self.videos = videos
+        self.rows = new
+        grid = self.GetView()
+        if grid is None:
+            return
+        grid.BeginBatch()
+        if new < old:
+            grid.ProcessTableMessage(gridlib.GridTableMessage(self, gridlib.GRIDTABLE_NOTIFY_ROWS_DELETED, new, old - new))
+        elif new > old:
+            grid.ProcessTableMessage(gridlib.GridTableMessage(self, gridlib.GRIDTABLE_NOTIFY_ROWS_APPENDED, new - old))
+        grid.EndBatch()
+        grid.ForceRefresh()
+
+    def GetNumberRows(self):
+        return self.rows
+
+    def GetNumberCols(self):
+        return len(self.COLUMNS)
+
+    def GetColLabelValue(self, col):
+        return self.COLUMNS[col]
+
+    def GetTypeName(self, row, col):
+        return gridlib.GRID_VALUE_BOOL if col == 0 else gridlib.GRID_VALUE_STRING
+
+    def IsEmptyCell(self, row, col):
+        return False
+
+    def GetValue(self, row, col):
+        if row >= len(self.videos):
+            return ""
+        if col == 0:
+            return '1' if row in self.selected_rows else '0'
+        if col == 1:
+            return self.videos[row].get("title") or ""
+        if col == 2:
+            return self.videos[row].get("id") or ""
+        snap = self.progress.get(row)
+        return snap[self.PROGRESS_KEYS[col]] if snap else self.PLACEHOLDERS[col]
+
+    def SetValue(self, row, col, value):
+        if col != 0:
+            return  # progress columns are driven by the ProgressTable
+        if value in ('1', True):
+            self.selected_rows.add(row)
+        else:
+            self.selected_rows.discard(row)
+
+    def GetAttr(self, row, col, kind):
+        if col == 3:
+            snap = self.progress.get(row)
+            if snap and snap['finished']:
+                self.done_attr.IncRef()
+                return self.done_attr
+        return None
 
-    def get_all(self):
-        return self.entries
-    
-    def get_by_indx(index):
-        return self.entries[index]
-    
-    def find_by_title(self, keyword: str):
-        return [e for e in self.entries if keyword.lower() in e.title.lower()]
-    
-    def find_by_url(self, keyword: str):
-        return [e for e in self.entries if keyword.lower() in e.url.lower()]
-
-    def find_playlists(self):
-        return [e for e in self.entries if e.is_playlist]
-
-    def __repr__(self):
-        return f"MediaLibrary({len(self.entries)} entries)"
-    def save_to_csv(self, path):
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write("Title,URL,FilePath,IsPlaylist\n")
-            for entry in self.entries:
-                f.write(entry.to_csv_line() + "\n")
-
-    def load_from_csv(self, path):
-        self.entries.clear()
-        with open(path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            for line in lines[1:]:  # Skip header
-                entry = MediaEntry.from_csv_line(line)
-                if entry:
-                    self.entries.append(entry)
-
-# Example usage
-#library = MediaLibrary()
-#library.add_entry("https://example.com/video1", "Intro to Python", "/videos/python_intro.mp4", False)
-#library.add_entry("https://example.com/playlist1", "Python Tutorials", "/videos/python_playlist.m3u", True)
 
-    
 class YouTubeDownloader(wx.Frame):
+    URL_DEBOUNCE_MS = 600
+
     def __init__(self):
         super().__init__(None, title="YouTube Downloader (yt_dlp)", size=(1100, 900))#style = wx.DEFAULT_FRAME_STYLE|wx.MAXIMIZE|wx.TAB_TRAVERSAL )
         
         self.video_list, self.selected_rows = [], set()
+        # job ids are journal keys (video + folder); these map them to the rows of the grid shown now
+        self.grid_jobs, self.job_rows = [], {}
         #self.Urls = (set())
         self.storage = MediaLibrary()
+        # nearly every job is on www.youtube.com, so the per-host cap follows the Workers control
+        self.engine = DownloadEngine(max_workers=4, per_host_limit=4)
+        self.scheduler = self.engine.scheduler
+        self.shared_queue = None  # SharedJobQueue that Download Selected sends to instead of the local engine
         self.curr_entity=MediaEntry("", "", "", False)
         self.curr_path="D:\YouTube_download_path"
         self.input_url=""
         self.playlist_url=""
         self.isplaylist=False
+        self.fetch_generation = 0
+        self.url_debounce = None
+        self.progress = ProgressTable()
+        self.log = LogBuffer(max_lines=2000, log_file=os.path.join(os.path.expanduser("~"), ".youtube_downloader", "downloader.log"))
+        self.log_level = LogBuffer.INFO  # lower levels only go to the log file
+        self.log_shown = 0  # lines in the output_log control, trimmed back to max_lines past LOG_SLACK
+        self.engine.subscribe(self.on_engine_event)
+        self.progress_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_progress_timer, self.progress_timer)
+        self.progress_timer.Start(100)  # repaint changed rows at 10 Hz
         
 
         # create menu
@@ -108,6 +256,9 @@ class YouTubeDownloader(wx.Frame):
         file_menu.Append(wx.ID_OPEN, "&Open\tCtrl+O", "Open .ydl file")
         file_menu.Append(wx.ID_SAVE, "&Save\tCtrl+S", "Save to .ydl file")
         file_menu.AppendSeparator()
+        export_metrics_item = file_menu.Append(wx.ID_ANY, "Export &metrics...", "Save download metrics as JSON or Prometheus text")
+        shared_queue_item = file_menu.Append(wx.ID_ANY, "Shared &queue...", "Send downloads to a job queue worked by headless workers")
+        file_menu.AppendSeparator()
         file_menu.Append(wx.ID_EXIT, "E&xit\tCtrl+Q", "Exit the application")
         menubar.Append(file_menu, "&File")
 
@@ -115,6 +266,9 @@ class YouTubeDownloader(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnOpen, id=wx.ID_OPEN)
         self.Bind(wx.EVT_MENU, self.OnSave, id=wx.ID_SAVE)
         self.Bind(wx.EVT_MENU, self.OnExit, id=wx.ID_EXIT)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)  # the title bar's close button too
+        self.Bind(wx.EVT_MENU, self.OnExportMetrics, export_metrics_item)
+        self.Bind(wx.EVT_MENU, self.OnSharedQueue, shared_queue_item)
 
         # Layout
         panel = wx.Panel(self)
@@ -174,7 +328,13 @@ class YouTubeDownloader(wx.Frame):
         self.delete_btn.Bind(wx.EVT_BUTTON, self.delete_data)
         self.Clear_btn = wx.Button(panel, label="Clear all")
         self.Clear_btn.Bind(wx.EVT_BUTTON, self.clear_data)
+        self.sync_btn = wx.Button(panel, label="Sync item")
+        self.sync_btn.Bind(wx.EVT_BUTTON, self.on_sync)
+        self.refresh_btn = wx.Button(panel, label="Refresh all")
+        self.refresh_btn.Bind(wx.EVT_BUTTON, self.on_refresh_all)
         self.delete_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.delete_sizer.Add(self.sync_btn, 0, wx.EXPAND | wx.ALL, 5)
+        self.delete_sizer.Add(self.refresh_btn, 0, wx.EXPAND | wx.ALL, 5)
         self.delete_sizer.Add(self.delete_btn, 0, wx.EXPAND | wx.ALL, 5)
         self.delete_sizer.Add(self.Clear_btn, 0, wx.EXPAND | wx.ALL, 5)
         #status text
@@ -198,30 +358,38 @@ class YouTubeDownloader(wx.Frame):
         self.Title_Lb.SetForegroundColour(wx.Colour(0, 0, 255)) # Set text color to red
         # Grid
         self.grid = wx.grid.Grid(panel)
-        self.grid.CreateGrid(0, 6)
+        self.grid_table = VideoGridTable(self.selected_rows, self.progress)
+        self.grid.SetTable(self.grid_table, takeOwnership=True)
         self.grid.SetRowLabelSize(20)
-        for i, col in enumerate(["✔", "Title", "ID", "%", "Speed", "Left time"]):#, "Size"
-            self.grid.SetColLabelValue(i, col)
         self.grid.SetMinSize((900, 500))
         self.grid.SetMaxSize((900, 900))
-        # Checkbox column setup
-        self.bool_attr = gridlib.GridCellAttr()
-        self.bool_attr.SetEditor(gridlib.GridCellBoolEditor())
-        self.bool_attr.SetRenderer(gridlib.GridCellBoolRenderer())
-        self.green_attr = gridlib.GridCellAttr()
-        self.green_attr.SetBackgroundColour(wx.Colour(144, 238, 144))  # light green
         
         
         self.grid.Bind(wx.grid.EVT_GRID_CELL_LEFT_CLICK, self.on_grid_click)
-        #self.grid.Bind(wx.grid.EVT_GRID_SELECT_CELL, self.on_select_row)
+        self.grid.Bind(wx.grid.EVT_GRID_CELL_RIGHT_CLICK, self.on_grid_right_click)
+        self.grid.Bind(wx.grid.EVT_GRID_SELECT_CELL, self.on_select_row)
         # Download and Status
         download_btn = wx.Button(panel, label="Download Selected")
         download_btn.Bind(wx.EVT_BUTTON, self.on_download_selected)
         self.check_box = wx.CheckBox(panel, label="Select all")
         self.check_box.Bind(wx.EVT_CHECKBOX , self.on_select_all)
+        self.workers_spin = wx.SpinCtrl(panel, min=1, max=32, initial=self.scheduler.max_workers)
+        self.workers_spin.Bind(wx.EVT_SPINCTRL, self.on_workers_change)
+        self.limit_spin = wx.SpinCtrl(panel, min=0, max=1000000, initial=0)  # KB/s, 0 = unlimited
+        self.limit_spin.Bind(wx.EVT_SPINCTRL, self.on_limit_change)
+        self.isolate_check = wx.CheckBox(panel, label="Separate processes")
+        self.isolate_check.SetToolTip("Run each download in its own worker process, restarted if it crashes or hangs")
+        self.isolate_check.Bind(wx.EVT_CHECKBOX, self.on_isolate_change)
+        self.queue_text = wx.StaticText(panel, label="")
         hbox_chechbox_dowenload = wx.BoxSizer(wx.HORIZONTAL)
         hbox_chechbox_dowenload.Add(download_btn, 0, wx.ALL, 5)
         hbox_chechbox_dowenload.Add(self.check_box, 0, wx.ALL, 5)
+        hbox_chechbox_dowenload.Add(wx.StaticText(panel, label="Workers:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 15)
+        hbox_chechbox_dowenload.Add(self.workers_spin, 0, wx.ALL, 5)
+        hbox_chechbox_dowenload.Add(wx.StaticText(panel, label="Limit KB/s:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 15)
+        hbox_chechbox_dowenload.Add(self.limit_spin, 0, wx.ALL, 5)
+        hbox_chechbox_dowenload.Add(self.isolate_check, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 15)
+        hbox_chechbox_dowenload.Add(self.queue_text, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
         
         vbox_grid = wx.BoxSizer(wx.VERTICAL)
         vbox_grid.Add(self.Title_Lb, 0, wx.ALL, 5)
@@ -242,46 +410,71 @@ class YouTubeDownloader(wx.Frame):
         left_sizer.Add(self.output_log, 0, wx.EXPAND | wx.LEFT  | wx.BOTTOM, 10)
         
         # Thumbnail panel
-        #self.thumbnail = wx.StaticBitmap(panel, size=(320, 180))
+        self.thumbnail = wx.StaticBitmap(panel, size=(320, 180))
+        self.thumbnail_id = None  # video the preview should show
+        self.thumbnails = ThumbnailLoader(self.engine.thumbnails, self.on_thumbnail_ready)
         main_sizer.Add(left_sizer, 1, wx.EXPAND)
-        #main_sizer.Add(self.thumbnail, 0, wx.RIGHT | wx.TOP, 10)
+        main_sizer.Add(self.thumbnail, 0, wx.RIGHT | wx.TOP, 10)
 
         panel.SetSizer(main_sizer)
         self.Maximize(True)
         self.Centre()
         self.Show()
+        wx.CallAfter(self.offer_resume)
 
-    def seconds_to_time(self,seconds):
-        if seconds is None:
-            return "00:00:00"
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs =round(seconds % 60, 2) 
-        return f"{hours:02}:{minutes:02}:{secs:02}"
-
-    def getchars(self,s,c='%',num_chars=5):
-        index = s.find(c)
-        tt=""
-        if index >= num_chars:
-            tt= s[index-num_chars:index]
-        return tt  # Not enough characters before %
-
-    def log_output(self, message):
-        #self.output_log.AppendText(message + "\n")
-        if isinstance(message, str):
-            self.output_log.AppendText("Output:\n" + message + "\n")
-        elif isinstance(message, list|set|tuple):
-            self.output_log.AppendText("List:\n")
-            for item in message:
-                self.output_log.AppendText(f"- {item}\n")
-        
-        elif isinstance(message, dict):
-            self.output_log.AppendText("Dictionary:\n")
-            for key, value in message.items():
-                self.output_log.AppendText(f"{key}: {value}\n")
-        else:
-            self.output_log.AppendText("Other:\n" + str("None") + "\n")
-        self.output_log.AppendText("===============================================================================\n")
+    def offer_resume(self):
+        pending = self.engine.journal.pending()
+        if not pending:
+            return
+        answer = wx.MessageBox(f"{len(pending)} download(s) did not finish last time.\nResume them now?",
+                               "Resume downloads", wx.YES_NO | wx.ICON_QUESTION)
+        if answer == wx.YES:
+            self.log_output(f"Resuming {len(self.engine.resume_pending())} unfinished download(s).")
+
+    LOG_COLOURS = {LogBuffer.DEBUG: wx.Colour(128, 128, 128), LogBuffer.WARNING: wx.Colour(200, 120, 0),
+                   LogBuffer.ERROR: wx.Colour(200, 0, 0)}
+    LOG_SLACK = 1.5  # the control may grow to this many times max_lines before the oldest lines are cut
+
+    def log_output(self, message, level=LogBuffer.INFO):
+        # safe from any thread, the text control is only touched by flush_log on the timer
+        self.log.append(message, level)
+
+    def flush_log(self):
+        lines, rebuild = self.log.drain()
+        lines = [(level, text) for level, text in lines if level >= self.log_level]
+        if not lines and not rebuild:
+            return
+        self.output_log.Freeze()
+        if rebuild:
+            self.output_log.Clear()
+            self.log_shown = 0
+        # one AppendText per run of same-level lines instead of one per line
+        start = 0
+        for n in range(1, len(lines) + 1):
+            if n == len(lines) or lines[n][0] != lines[start][0]:
+                colour = self.LOG_COLOURS.get(lines[start][0], wx.BLACK)
+                self.output_log.SetDefaultStyle(wx.TextAttr(colour))
+                self.output_log.AppendText("".join(text + "\n" for _, text in lines[start:n]))
+                start = n
+        self.log_shown += len(lines)
+        if self.log_shown > self.log.lines.maxlen * self.LOG_SLACK:
+            self.trim_log(self.log_shown - self.log.lines.maxlen)
+        self.output_log.Thaw()
+
+    def trim_log(self, count):
+        # drop only the oldest count lines; runs once per max_lines / 2 new lines, not on every flush
+        text = self.output_log.GetValue()
+        end = -1
+        for _ in range(count):
+            end = text.find("\n", end + 1)
+            if end < 0:
+                break
+        if end < 0:
+            self.output_log.Clear()
+            self.log_shown = 0
+            return
+        self.output_log.Remove(0, end + 1)
+        self.log_shown -= count
 
     def RefreshDisplay(self):
         self.list_box.Clear()
@@ -334,28 +527,13 @@ class YouTubeDownloader(wx.Frame):
             'quiet': False
         }
 
-    def merge_audio_video(video_file, audio_file, output_file):
-        command = [
-            'ffmpeg',
-            '-i', video_file,
-            '-i', audio_file,
-            '-c:v', 'copy',
-            '-c:a', 'aac',
-            '-strict', 'experimental',
-            '-y',  # overwrite output
-            output_file
-        ]
-
-        subprocess.run(command)
-        print(f"Merged into: {output_file}")
-
 #events
     def OnOpen(self, event):
         with wx.FileDialog(self, "Open .ydl file", wildcard="*.ydl",style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dlg:
             if dlg.ShowModal() == wx.ID_OK:
                 path = dlg.GetPath()
                 try:
-                    self.storage.load_from_csv(path)
+                    self.storage.open(path)
                     self.fill_list(self)
                     #self.RefreshDisplay()
                 except Exception as e:
@@ -366,39 +544,88 @@ class YouTubeDownloader(wx.Frame):
             if dlg.ShowModal() == wx.ID_OK:
                 path = dlg.GetPath()
                 try:
-                    self.storage.save_to_csv(path)
+                    self.storage.save(path)
                     wx.MessageBox("Library saved successfully.", "Saved", wx.OK | wx.ICON_INFORMATION)
                 except Exception as e:
                     wx.MessageBox(f"Failed to save file:\n{e}", "Error", wx.OK | wx.ICON_ERROR)
 
+    def OnExportMetrics(self, event):
+        with wx.FileDialog(self, "Export metrics", wildcard="JSON (*.json)|*.json|Prometheus text (*.prom)|*.prom",
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+            if dlg.ShowModal() == wx.ID_OK:
+                try:
+                    self.engine.export_metrics(dlg.GetPath())
+                except Exception as e:
+                    wx.MessageBox(f"Failed to export metrics:\n{e}", "Error", wx.OK | wx.ICON_ERROR)
+
+    def OnSharedQueue(self, event):
+        if self.shared_queue is not None:
+            if wx.MessageBox(f"Downloads go to the shared queue\n{self.shared_queue.path}\n\nDownload locally again?",
+                             "Shared queue", wx.YES_NO | wx.ICON_QUESTION) == wx.YES:
+                self.shared_queue.close()
+                self.shared_queue = None
+                self.status_text.SetLabel("Downloading locally.")
+            return
+        with wx.FileDialog(self, "Shared job queue", wildcard="Job queue (*.queue)|*.queue|All files (*.*)|*.*",
+                           style=wx.FD_SAVE) as dlg:
+            if dlg.ShowModal() == wx.ID_OK:
+                try:
+                    self.shared_queue = SharedJobQueue(dlg.GetPath())
+                except Exception as e:
+                    wx.MessageBox(f"Failed to open the job queue:\n{e}", "Error", wx.OK | wx.ICON_ERROR)
+                    return
+                self.status_text.SetLabel("Downloads go to the shared queue " + dlg.GetPath())
+
     def OnExit(self, event):
         self.Close(True)
+
+    def OnClose(self, event):
+        self.progress_timer.Stop()
+        if self.shared_queue is not None:
+            self.shared_queue.close()
+        self.engine.shutdown()
+        event.Skip()  # let the frame be destroyed
     
+    def confirm_removal(self, what):
+        # the library writes through to an opened .ydl file, there is no Save to back out of
+        where = "\nThis also removes it from the opened .ydl file." if self.storage.store is not None else ""
+        return wx.MessageBox(f"Remove {what}?{where}", "Confirm", wx.YES_NO | wx.NO_DEFAULT | wx.ICON_WARNING) == wx.YES
+
     def clear_data(self,_):
-        self.storage.entries.clear()
+        if not self.storage.get_all() or not self.confirm_removal("all entries from the library"):
+            return
+        self.storage.clear()
         self.list_box.Clear()
-        self.grid.ClearGrid()
+        self.grid_table.set_videos([])
         self.status_text.SetLabel("Cleared all data.")
         self.Title_Lb.SetLabel("Cleared all data.")
     def delete_data(self,_):
         selected_index = self.list_box.GetSelection()
-        if selected_index != wx.NOT_FOUND:
-            del self.storage.entries[selected_index]
+        if selected_index != wx.NOT_FOUND and self.confirm_removal(f'"{self.list_box.GetString(selected_index)}"'):
+            self.storage.delete_entry(selected_index)
             self.list_box.Delete(selected_index)
-            self.grid.ClearGrid()
+            self.grid_table.set_videos([])
             self.status_text.SetLabel("Deleted selected item.")  
             self.list_box.SetSelection(0)  
     def modify_url_txt(self,event):
+        # typing or pasting fires this per character, only act once the text settles
+        if self.url_debounce is None:
+            self.url_debounce = wx.CallLater(self.URL_DEBOUNCE_MS, self.on_url_settled)
+        else:
+            self.url_debounce.Restart(self.URL_DEBOUNCE_MS)
+        event.Skip()
+
+    def on_url_settled(self):
         input_url=self.url_text.GetValue().strip()
         self.rest_path()
-        if self.storage.find_by_url(input_url) :#if url in [e.url for e in self.storage.entries]:
+        if self.storage.contains_url(input_url):
             self.status_text.SetLabel( "This URL already exists in the library, and has been feched.")
-            self.log_output("URL already fetched:" +self.curr_entity.url)
+            self.log_output("URL already fetched:" +input_url)
             wx.MessageBox("This URL already exists in the library.", "Duplicate Entry", wx.OK | wx.ICON_WARNING)
             #make select on list box
-            event.Skip()
         else:
-            self.curr_entity.url=input_url#self.url_text.GetValue().strip()
+            # new entity: curr_entity may be a library entry, whose url is indexed
+            self.curr_entity = MediaEntry(input_url, "", self.curr_path, False)
             self.rest_path()
             self.on_fetch(self)
         
@@ -441,6 +668,8 @@ class YouTubeDownloader(wx.Frame):
 
     def select_listbox_item(self, event):
         selected_index = self.list_box.GetSelection()
+        if self.url_debounce is not None:
+            self.url_debounce.Stop()  # the list selection wins over half-typed text
         self.curr_entity=self.storage.entries[selected_index]
         #self.input_url=self.curr_entity.url
         self.rest_path()
@@ -455,90 +684,107 @@ class YouTubeDownloader(wx.Frame):
             self.log_output("Found valid URL:" +self.curr_entity.url+"\n Please wiat untill found all files.")
             #self.Urls.add(self.input_url)
             self.status_text.SetLabel("Fetching...............................")
-            threading.Thread(target=self.fetch_videos, args=(self.curr_entity.url,self.curr_path)).start()
+            # latest request wins: results of older fetches still running are dropped
+            self.fetch_generation += 1
+            threading.Thread(target=self.fetch_videos, args=(self.curr_entity.url,self.curr_path,self.fetch_generation), daemon=True).start()
         elif self.curr_entity.url:  # Only show warning for non-empty strings
-            self.output_log.AppendText(f"⚠️  Skipping invalid URL: {self.curr_entity.url}\n Please enter a URL.")
+            self.log_output(f"⚠️  Skipping invalid URL: {self.curr_entity.url}\n Please enter a URL.", LogBuffer.WARNING)
             self.status_text.SetLabel("Please enter correct URL.")
     
         if not self.curr_entity.url:
             self.status_text.SetLabel("Please enter correct URL.")
             return
 
-    def fetch_videos(self, url,full_path):
+    def is_stale_fetch(self, generation) -> bool:
+        return generation is not None and generation != self.fetch_generation
+
+    def fetch_videos(self, url,full_path, generation=None):
         try:
-            self.video_list.clear()
-            #if is_playlist_url(url):
-            with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-            self.title=info.get('title')
-            self.video_list = info['entries'] if 'entries' in info else [info]
-            self.isplaylist=False
-            if "list" in url:
-                self.playlist_url=info.get('url')
-                #self.playlist_videos_count=info.get('playlist_count')
-                self.isplaylist=True
-                with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': True}) as ydl:
-                    info = ydl.extract_info(self.playlist_url, download=False)
-                    #wx.CallAfter(self.log_output,self.log_output(info))
-                    #self.title=info['title']
-                self.curr_path = os.path.join(full_path,info['title'])#, '%(playlist_index)s-%(title)s.%(ext)s'
-                self.path_text.SetValue(self.curr_path)
-                    #wx.CallAfter(self.log_output,self.log_output(f"🎵 [Thread {0}] Detected playlist URL. Downloading entire playlist..."))
-        
-                self.video_list = info['entries'] if 'entries' in info else [info]
-                self.log_output("number of fetched videos:" +str(len(self.video_list)))#self.video_list))
-                wx.CallAfter(self.status_text.SetLabel, f"{len(self.video_list)} video(s) found.")
-                
-            self.curr_entity = MediaEntry(url, self.title, self.curr_path, self.isplaylist)
-            if url in [e.url for e in self.storage.entries]:
-                wx.CallAfter(self.status_text.SetLabel, "This URL has been feched.")
-                # Avoid duplicates
-            else:
-                self.storage.add_entry(url, self.title, self.curr_path, self.isplaylist)
-                self.list_box.Append(self.curr_entity.title)#if url in [e.url for e in self.entries] len(self.storage)-1
-            #self.list_box.SetSelection(self.list_box.GetCount()-1)
-            wx.CallAfter(self.update_grid)
+            self.engine.fetch(url, on_info=lambda info: wx.CallAfter(self.apply_fetch_result, generation, url, info, full_path),
+                              cancelled=lambda: self.is_stale_fetch(generation),
+                              on_page=lambda info, start, done: wx.CallAfter(self.apply_fetch_page, generation, url, info,
+                                                                            start, done, full_path))
         except Exception as e:
-            wx.CallAfter(self.status_text.SetLabel, f"Error: {str(e)}")
+            if not self.is_stale_fetch(generation):
+                wx.CallAfter(self.status_text.SetLabel, f"Error: {str(e)}")
+
+    def apply_fetch_result(self, generation, url, info, full_path, partial=False):
+        # runs on the UI thread, so the generation check can't race a new on_fetch
+        if self.is_stale_fetch(generation):
+            return
+        self.title = info.get('title')
+        # compact records only, the full info dicts are dropped with info
+        self.video_list = video_records(info)
+        self.isplaylist = "list" in url or info.get('_type') == 'playlist'
+        if self.isplaylist:
+            self.playlist_url = info.get('webpage_url') or url
+            self.curr_path = os.path.join(full_path, info.get('title') or "")#, '%(playlist_index)s-%(title)s.%(ext)s'
+            self.path_text.SetValue(self.curr_path)
+            if not partial:
+                self.log_output("number of fetched videos:" +str(len(self.video_list)))
+        self.status_text.SetLabel(f"{len(self.video_list)} video(s) found" + (" so far..." if partial else "."))
+        self.curr_entity = MediaEntry(url, self.title, self.curr_path, self.isplaylist)
+        if self.storage.contains_url(url):
+            self.status_text.SetLabel("This URL has been feched.")
+            # Avoid duplicates
+        else:
+            self.storage.add_entry(url, self.title, self.curr_path, self.isplaylist)
+            self.list_box.Append(self.curr_entity.title)
+        self.update_grid()
+
+    def apply_fetch_page(self, generation, url, info, start, done, full_path):
+        # pages of an uncached playlist: the first one sets everything up, the rest only append rows
+        if self.is_stale_fetch(generation):
+            return
+        if start == 0:
+            self.apply_fetch_result(generation, url, info, full_path, partial=not done)
+            return
+        page = video_records(info)
+        for row in self.engine.finished_rows(page, self.curr_path, len(self.video_list)):
+            self.progress.update(row, '100%', finished=True)
+        self.video_list.extend(page)
+        self.map_jobs(len(self.video_list) - len(page))
+        self.grid_table.set_videos(self.video_list)
+        if done:
+            self.fit_grid_columns()
+            self.log_output("number of fetched videos:" + str(len(self.video_list)))
+            self.status_text.SetLabel(f"{len(self.video_list)} video(s) found.")
+        else:
+            self.status_text.SetLabel(f"{len(self.video_list)} video(s) found so far...")
 
     def update_grid(self):
-        self.grid.ClearGrid()
-        for row in range(self.grid.GetNumberRows() - 1, -1, -1) :#in range(self.grid.GetNumberRows()):
-            for col in range(self.grid.GetNumberCols()):
-                self.grid.SetCellEditor(row, col, None)
-                self.grid.SetCellRenderer(row, col, None)
-            self.grid.DeleteRows(pos=row, numRows=1)
-
-        label="Title: " + self.curr_entity.title
+        label="Title: " + (self.curr_entity.title or "")
         self.Title_Lb.SetLabel(label)
-        #if self.curr_entity.is_playlist:
-        # self.grid.AppendRows(1)
-        # self.grid.SetCellSize(0, 0, 1,self.grid.GetNumberCols())
-        # self.grid.SetCellValue(0, 0, self.curr_entity.title or "Playlist Title")
-        # self.grid.SetBackgroundColour(wx.Colour(144, 238, 144))
-        # self.grid.SetCellAlignment(0, 0, wx.ALIGN_CENTRE, wx.ALIGN_CENTRE)
-            
-        #if self.grid.GetNumberRows() > 0:
-        #    self.grid.DeleteRows(0, self.grid.GetNumberRows())
         self.selected_rows.clear()
-        for i, video in enumerate(self.video_list):
-            self.grid.AppendRows(1)
-            #self.grid.SetCellValue(i, 0, "☐")
-            #self.grid.SetCellValue(i+nrows, 0,str(i+1))
-            self.grid.SetAttr(i, 0, self.bool_attr.Clone())
-            self.grid.SetCellValue(i, 0, '0')  # unchecked
-            self.grid.SetCellValue(i, 1, video.get("title", ""))
-            self.grid.SetCellValue(i, 2, video.get("id", ""))
-            #self.grid.SetAttr(i, 3, self.progress_attr.Clone())
-            self.grid.SetCellValue(i, 3, "__________")
-            self.grid.SetCellValue(i, 4, "__________")
-            self.grid.SetCellValue(i, 5, "______________")
-            #self.grid.SetCellValue(i, 6, "_________________")
-        #to avoid to select the first row
-        self.grid.AutoSizeColumns()
-        self.grid.SetAttr(0, 0, self.bool_attr.Clone())
-        self.grid.SetCellValue(0, 0, '1' )
-        self.selected_rows.add(0)
+        self.progress.clear()
+        for row in self.engine.finished_rows(self.video_list, self.curr_path):
+            self.progress.update(row, '100%', finished=True)
+        if self.video_list:
+            self.selected_rows.add(0)  # first row checked by default
+        self.map_jobs()
+        self.grid_table.set_videos(self.video_list)
+        self.fit_grid_columns()
+        self.show_thumbnail(0)
+
+    def map_jobs(self, start: int = 0):
+        # events of jobs from other playlists (or folders) find no row and leave this grid alone
+        if start == 0:
+            self.grid_jobs, self.job_rows = [], {}
+        for row, video in enumerate(self.video_list[start:], start):
+            job_id = JobJournal.key(watch_url(video), self.curr_path)
+            self.grid_jobs.append(job_id)
+            self.job_rows[job_id] = row
+
+    def fit_grid_columns(self):
+        # measure only the longest title and id instead of autosizing every cell
+        dc = wx.ClientDC(self.grid)
+        dc.SetFont(self.grid.GetDefaultCellFont())
+        for col, key in ((1, "title"), (2, "id")):
+            longest = max((v.get(key) or "" for v in self.video_list), key=len, default="")
+            width = max(dc.GetTextExtent(longest)[0], dc.GetTextExtent(VideoGridTable.COLUMNS[col])[0]) + 10
+            self.grid.SetColSize(col, width)
+        for col in range(3, 6):
+            self.grid.SetColSize(col, dc.GetTextExtent(VideoGridTable.PLACEHOLDERS[col])[0] + 10)
 
     def on_grid_click(self, event):
         row, col = event.GetRow(), event.GetCol()
@@ -547,158 +793,263 @@ class YouTubeDownloader(wx.Frame):
             #     self.check_box.SetValue(True)
             #     self.on_select_all(self,event)
             
+            # the table writes the checkbox straight into selected_rows
             mark = self.grid.GetCellValue(row, 0)
-            self.grid.SetAttr(row, 0, self.bool_attr.Clone())
             self.grid.SetCellValue(row, 0, '1' if mark == '0' else '0')
-            mark = self.grid.GetCellValue(row, 0)
-            if mark=='1':
-                self.selected_rows.add(row)
-            else:
-                self.selected_rows.discard(row)
             #self.grid.SetCellValue(row, 0, "☑" if mark == "☐" else "☐")
             #(self.selected_rows.add if mark == "☐" else self.selected_rows.discard)(row)
             #print(self.selected_rows)
-            self.log_output(f"Selected rows: {self.selected_rows}")
+            self.log_output(f"Selected rows: {self.selected_rows}", LogBuffer.DEBUG)
         event.Skip()
     
     def on_select_all(self, event):
         try:
             checked = self.check_box.GetValue()
-            value = '1' if checked else '0'
-            for row in range(self.grid.GetNumberRows()):
-                self.grid.SetCellValue(row, 0, value)
-                #(self.selected_rows.add if self.grid.GetCellValue(row,0) == 0 else self.selected_rows.discard)(row)
-                if checked:
-                    self.selected_rows.add(row)
-                else:
-                    self.selected_rows.discard(row)
-            self.log_output(f"Selected rows: {self.selected_rows}")        
+            if checked:
+                self.selected_rows.update(range(self.grid.GetNumberRows()))
+            else:
+                self.selected_rows.clear()
+            self.grid.ForceRefresh()
+            self.log_output(f"Selected rows: {len(self.selected_rows)}", LogBuffer.DEBUG)
         except Exception:
             pass
         event.Skip()
         
+    THUMBNAIL_PREFETCH = 2  # rows on each side of the selected one
+
     def on_select_row(self, event):
         row = event.GetRow()
-        try:
-            self.log_output("Selected row: "+ row)
-            #video = self.video_list[row]
-            #thumb_url = video.get('thumbnail') or f"https://img.youtube.com/vi/{video['id']}/0.jpg"
-            #img_data = requests.get(thumb_url).content
-            #img = wx.Image(BytesIO(img_data)).Scale(320, 180)
-            #self.thumbnail.SetBitmap(wx.Bitmap(img))
-        except Exception:
-            pass
+        self.log_output(f"Selected row: {row}", LogBuffer.DEBUG)
+        self.show_thumbnail(row)
         event.Skip()
+
+    def show_thumbnail(self, row):
+        # never loads anything here: a cached bitmap is shown, everything else is queued for the workers
+        if not 0 <= row < len(self.video_list or []):
+            return
+        video = self.video_list[row]
+        self.thumbnail_id = video.get('id')
+        bitmap = self.thumbnails.get(self.thumbnail_id)
+        self.thumbnail.SetBitmap(bitmap if bitmap is not None else wx.NullBitmap)
+        lo, hi = max(0, row - self.THUMBNAIL_PREFETCH), min(len(self.video_list), row + self.THUMBNAIL_PREFETCH + 1)
+        # neighbours first, the selected row last so it is loaded first
+        self.thumbnails.request([self.video_list[i] for i in range(lo, hi) if i != row] + [video])
+
+    def on_thumbnail_ready(self, video_id, bitmap):
+        if video_id == self.thumbnail_id:
+            self.thumbnail.SetBitmap(bitmap)
     
 
+    def on_sync(self, _):
+        # re-list the selected library entry and download only what the archive doesn't have
+        selected_index = self.list_box.GetSelection()
+        if selected_index == wx.NOT_FOUND:
+            self.status_text.SetLabel("Select a library item to sync.")
+            return
+        entry = self.storage.entries[selected_index]
+        self.fetch_generation += 1
+        self.status_text.SetLabel("Syncing...")
+        threading.Thread(target=self.sync_entry, args=(entry, self.fetch_generation), daemon=True).start()
+
+    def sync_entry(self, entry, generation):
+        try:
+            info, rows = self.engine.plan_sync(entry.url)
+        except Exception as e:
+            if not self.is_stale_fetch(generation):
+                wx.CallAfter(self.status_text.SetLabel, f"Error: {str(e)}")
+            return
+        wx.CallAfter(self.apply_sync_result, generation, entry, info, rows)
+
+    def apply_sync_result(self, generation, entry, info, rows):
+        if self.is_stale_fetch(generation):
+            return
+        # library entries of playlists store the playlist folder, apply_fetch_result adds the title again
+        full_path = entry.file_path or self.curr_path
+        if entry.is_playlist and entry.file_path:
+            full_path = os.path.dirname(full_path)
+        self.apply_fetch_result(generation, entry.url, info, full_path)
+        self.selected_rows.clear()
+        self.selected_rows.update(rows)
+        self.grid.ForceRefresh()
+        self.log_output(f"Sync: {len(rows)} new or missing of {len(self.video_list)} video(s).")
+        self.status_text.SetLabel(f"Sync: {len(rows)} new or missing video(s).")
+        if rows:
+            # the journal may still say "done" for files deleted since, so don't let it skip them
+            self.download_rows(rows, force=True)
+
+    def on_refresh_all(self, _):
+        # every library entry is re-extracted on the engine's refresh pool, the UI only gets events
+        urls = [entry.url for entry in self.storage.entries]
+        if not urls:
+            self.status_text.SetLabel("The library is empty.")
+            return
+        self.refresh_btn.Disable()
+        self.refresh_total, self.refresh_count = len(urls), 0
+        self.status_text.SetLabel(f"Refreshing 0/{len(urls)}...")
+        self.engine.refresh_all(urls, on_done=lambda results: wx.CallAfter(self.show_refresh_summary, results))
+
+    def show_refresh_progress(self, data):
+        self.refresh_count += 1
+        self.status_text.SetLabel(f"Refreshing {self.refresh_count}/{self.refresh_total}...")
+        if not data['success']:
+            self.log_output(f"Refresh failed for {data['url']}: {data['message']}", LogBuffer.WARNING)
+
+    def show_refresh_summary(self, results):
+        self.refresh_btn.Enable()
+        changed = [r for r in results if r['success'] and (r['new'] or r['not_downloaded'])]
+        failed = sum(1 for r in results if not r['success'])
+        lines = [f"{r['title'] or r['url']}: {r['new']} new, {r['not_downloaded']} not downloaded" for r in changed]
+        slowest = max((r['seconds'] for r in results), default=0)
+        self.log_output(lines or "Refresh: nothing new.")
+        self.status_text.SetLabel(f"Refreshed {len(results)} item(s): {len(changed)} with new videos, {failed} failed "
+                                  f"(slowest {slowest:.1f}s).")
+        if changed:
+            wx.MessageBox("\n".join(lines[:30]) + (f"\n... and {len(lines) - 30} more" if len(lines) > 30 else ""),
+                          "Refresh all", wx.OK | wx.ICON_INFORMATION)
+
     def on_download_selected(self, _):
+        self.download_rows(self.selected_rows)
+
+    def download_rows(self, rows, force=False):
         path = self.curr_path #.path_text.GetValue().strip()
-        if not path or not self.selected_rows:
+        if not path or not rows:
             self.status_text.SetLabel("Select path and videos first.")
             return
         #curr_url = f"https://www.youtube.com/watch?v={ self.grid.GetCellValue(0, 2)}"
         #wx.CallAfter(self.log_output,curr_url)
-        selected = [(i, self.video_list[i]) for i in self.selected_rows]
+        selected = [(i, self.video_list[i]) for i in rows]
+        if self.shared_queue is not None:
+            jobs = [(watch_url(video), path, row + 1 if self.isplaylist else None, self.curr_entity.url or None, row)
+                    for row, video in sorted(selected)]
+            threading.Thread(target=self.queue_jobs, args=(self.shared_queue, jobs, force), daemon=True).start()
+            return
         #print (selected) #wx.CallAfter(self.log_output,f"{for i in selected}")
         #fmt = self.format_choice.GetStringSelection()
         #threading.Thread(target=self.download_videos, args=(selected, path, fmt)).start()
         #for i in self.selected_rows:
-        for row, video in selected:
-            print(video)
-            url = f"https://www.youtube.com/watch?v={video['id']}"
-            threading.Thread(target=self.download_single_video1, args=(url, path,0,row)).start()
+        for row, video in sorted(selected):
+            # the same video and folder always get the same job id, whichever grid row it sits in
+            self.engine.submit(JobJournal.key(watch_url(video), path), watch_url(video), path, playlist_index=row + 1 if self.isplaylist else None, priority=row,
+                               entry_url=self.curr_entity.url or None, force=force)
         #self.download_youtube_content([curr_url],path)
         #xx=["https://www.youtube.com/watch?v=a2srHUwtob8&list=PLcQHTE-X8-qjoEAFnzqw9XVsIP4g_nbLJ&index=3"]
         #threading.Thread(target=self.download_youtube_content, args=(xx, path)).start()
-    def download_single_video1(self,url: str, output_path: str, thread_id: int = 0,selected_row:int=0) -> dict:
-        """
-        Download a single YouTube video or playlist.
-        Args:
-            url (str): YouTube URL to download
-            output_path (str): Directory to save the download
-            thread_id (int): Thread identifier for logging
-        Returns:
-            dict: Result status with success/failure info
-        """
-        def hook(d):
-                    if d['status'] == 'downloading':
-                        p=d.get('_percent_str', '').strip('% ')
-                        s=d.get('_speed_str', '').strip()
-                        eta=d.get('eta', '')
-                        tt=self.getchars( p,'%',5)
-                        sp=self.getchars( s,'K',7)+'kb'
-                        eta_hms=self.seconds_to_time(eta)
-                        #wx.CallAfter(self.grid.SetAttr(selected_row, 3, self.progress_attr.Clone()))
-                        wx.CallAfter(self.grid.SetCellValue, selected_row, 3,tt+'%')
-                        wx.CallAfter(self.grid.SetCellValue, selected_row, 4,sp )
-                        wx.CallAfter(self.grid.SetCellValue, selected_row, 5,str(eta_hms) )
-                        #wx.CallAfter(self.grid.SetCellValue, selected_row, 5, d.get('_total_bytes_str', '') or '')
-                        
-                        #wx.CallAfter(self.log_output,self.log_output(p))
-                        xt=self.getchars(p,'%',5)
-                        wx.CallAfter(self.log_output,"Precent ="+xt+"%, Speed ="+sp+", Left time ="+eta_hms)
-                    elif d['status'] == 'finished':
-                        wx.CallAfter(self.grid.SetCellValue, selected_row, 3, '100%')
-                        wx.CallAfter(self.grid.SetCellBackgroundColour, selected_row, 3, wx.Colour(144, 238, 144))
-                        url = f"https://www.youtube.com/watch?v={self.grid.GetCellValue(selected_row, 2)}"
-                        wx.CallAfter(self.log_output,"✅file no." + str(selected_row+1)+" "+url+" downloaded")
-                        
-                    
-        format_selector = (
-            # Try best video+audio combination first
-            'bestvideo[height<=1080]+bestaudio/best[height<=1080]/'
-            # Fallback to best available quality
-            'best'
-        )
-        
-        # Configure yt-dlp options for MP4 only
-        ydl_opts = {
-            #'format': format_selector,
-            'merge_output_format': 'mp4',
-            'ignoreerrors': True,
-            'no_warnings': False,
-            'extract_flat': False,
-            # Disable all additional downloads for clean MP4-only output
-            'writesubtitles': False,
-            'writethumbnail': False,
-            'writeautomaticsub': False,
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }],
-            # Clean up options
-            'keepvideo': False,
-            'clean_infojson': True,
-            'retries': 3,
-            'fragment_retries': 3,
-            'progress_hooks': [hook],
-        }
-        # Set different output templates for playlists and single videos
-        if self.isplaylist:
-            ydl_opts['outtmpl'] = os.path.join(output_path, '%(playlist_index)s-%(title)s.%(ext)s')#'%(playlist_title)s'
-            print( f"🎵 [Thread {thread_id}] Detected playlist URL. Downloading entire playlist...")
-        else:
-            ydl_opts['outtmpl'] = os.path.join(output_path, '%(title)s.%(ext)s')
-            print( f"🎥 [Thread {thread_id}] Detected single video URL. Downloading video...")
+
+    def queue_jobs(self, queue, jobs, force=False):
+        # the queue file may sit on a network share, keep its locking off the UI thread
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Download content
-                ydl.download([url])
-                #wx.CallAfter(self.log_output,self.log_output(url))
-                #wx.CallAfter(self.log_output,"✅ [Thread "+thread_id+"] Download completed successfully!")
-                return {
-                    'url': url,
-                    'success': True,
-                    'message': f"✅ [Thread {thread_id}] Download completed successfully!"
-                }
+            added = queue.put_many(jobs, force=force)
+            message = f"Queued {added} of {len(jobs)} videos for the workers of {queue.path}"
         except Exception as e:
-            wx.CallAfter(self.log_output,"Error: {"+str(e)+"}")
-            return {
-                'url': url,
-                'success': False,
-                'message': f"❌ [Thread {thread_id}] Error: {str(e)}"
-            }
-            
+            message = f"Failed to queue videos: {e}"
+        wx.CallAfter(self.status_text.SetLabel, message)
+        self.log_output(message)
+
+    def on_engine_event(self, event, data):
+        # called on engine threads: progress and log lines go into buffers drained by the timer, the rest is marshalled
+        # jobs of other playlists have no row in the current grid
+        row = self.job_rows.get(data.get('job_id'))
+        if event == 'progress':
+            if row is not None:
+                self.progress.update(row, format_percent(data['downloaded_bytes'], data['total_bytes']),
+                                     format_speed(data['speed']), seconds_to_time(data['eta']))
+        elif event in ('finished', 'skipped'):
+            if row is not None:
+                self.progress.update(row, '100%', finished=True)
+            label = "already downloaded" if event == 'skipped' else "downloaded"
+            self.log_output("✅file " + str(data['job_id'])+" "+data['url']+" "+label)
+        elif event == 'done':
+            timing = f"download {data['download_time']}s, post-processing {data['postprocess_time']}s"
+            if data.get('action'):
+                timing += f" ({data['action']})"
+            self.log_output(data['message'] + " " + timing, LogBuffer.INFO if data['success'] else LogBuffer.ERROR)
+        elif event == 'queue':
+            wx.CallAfter(self.show_scheduler_stats, data)
+        elif event == 'refreshed':
+            wx.CallAfter(self.show_refresh_progress, data)
+        elif event == 'log':
+            self.log_output(data['message'])
+
+    def on_workers_change(self, _):
+        workers = self.workers_spin.GetValue()
+        self.scheduler.set_per_host_limit(workers)
+        self.scheduler.set_max_workers(workers)
+
+    def on_limit_change(self, _):
+        # applies to downloads already running, not only new ones
+        self.engine.limiter.set_rate(self.limit_spin.GetValue() * 1024)
+
+    def on_isolate_change(self, _):
+        # only new downloads switch over, running ones finish where they are
+        self.engine.set_isolated(self.isolate_check.GetValue())
+
+    def show_scheduler_stats(self, stats):
+        self.queue_text.SetLabel(f"Queued: {stats['queued'] + stats['waiting']}  Paused: {stats['paused']}  "
+                                 f"Active: {stats['active']}/{stats['workers']}")
+
+    def on_progress_timer(self, _):
+        self.flush_log()
+        changed = self.progress.drain()
+        if not changed:
+            return
+        rows = self.grid.GetNumberRows()
+        # the table reads the snapshots itself, just repaint the changed cells
+        for row in changed:
+            if row < rows:
+                self.grid.RefreshBlock(row, 3, row, 5)
+
+    def on_grid_right_click(self, event):
+        row = event.GetRow()
+        if not 0 <= row < len(self.video_list or []):
+            event.Skip()
+            return
+        video = self.video_list[row]
+        job = self.scheduler.jobs.get(self.grid_jobs[row]) if row < len(self.grid_jobs) else None
+        menu = wx.Menu()
+        details_item = menu.Append(wx.ID_ANY, "Details...")
+        # bound on the menu, so the handlers and the job they hold go away with it
+        menu.Bind(wx.EVT_MENU, lambda _: self.show_details(video), details_item)
+        if job is not None:
+            menu.AppendSeparator()
+            pause_item = menu.Append(wx.ID_ANY, "Pause")
+            resume_item = menu.Append(wx.ID_ANY, "Resume")
+            cancel_item = menu.Append(wx.ID_ANY, "Cancel")
+            pause_item.Enable(job.state in ("queued", "running"))
+            resume_item.Enable(not job._resume.is_set() and not job.cancelled)
+            cancel_item.Enable(job.state in ("queued", "paused", "waiting", "running"))
+            menu.Bind(wx.EVT_MENU, lambda _: self.scheduler.pause(job.job_id), pause_item)
+            menu.Bind(wx.EVT_MENU, lambda _: self.scheduler.resume(job.job_id), resume_item)
+            menu.Bind(wx.EVT_MENU, lambda _: self.engine.cancel(job.job_id), cancel_item)
+        self.grid.PopupMenu(menu)
+        menu.Destroy()
+
+    def show_details(self, video):
+        # the grid only keeps compact records, the full metadata is extracted now
+        self.status_text.SetLabel(f"Loading details of {video.get('title')}...")
+        threading.Thread(target=self.load_details, args=(video,), daemon=True).start()
+
+    def load_details(self, video):
+        try:
+            info = self.engine.full_info(video)
+        except Exception as e:
+            wx.CallAfter(self.status_text.SetLabel, f"Error: {str(e)}")
+            return
+        wx.CallAfter(self.apply_details, info)
+
+    def apply_details(self, info):
+        self.status_text.SetLabel(info.get('title') or "")
+        description = info.get('description') or ""
+        lines = [
+            info.get('title') or "",
+            f"Channel: {info.get('channel') or info.get('uploader') or '-'}",
+            f"Uploaded: {info.get('upload_date') or '-'}",
+            f"Duration: {seconds_to_time(info.get('duration'))}",
+            f"Views: {info.get('view_count') or '-'}",
+            f"Formats: {len(info.get('formats') or [])}",
+            "",
+            description[:1000] + ("..." if len(description) > 1000 else ""),
+        ]
+        wx.MessageBox("\n".join(lines), "Details", wx.OK | wx.ICON_INFORMATION)
 
 if __name__ == '__main__':
     app = wx.App(False)
@@ -0,0 +1,693 @@
+"""
+Offline benchmarks for the YouTube downloader.
+
+Everything runs against a local HTTP server that serves synthetic media files
+and flat playlist JSON, so no request goes to YouTube. Each scenario reports
+throughput, latency percentiles and the process's peak RSS; results can be
+saved as a baseline and later runs compared against it.
+
+    python benchmark.py                      # run every scenario
+    python benchmark.py --only library,fetch
+    python benchmark.py --save-baseline      # write benchmark_baseline.json
+    python benchmark.py --compare            # flag metrics >20% worse than the baseline
+
+yt-dlp must be installed, since download_engine imports it; the scenarios
+that need wxPython (grid, progress_ui) are skipped when wxPython is not installed.
+"""
+import argparse
+import http.server
+import importlib.util
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ProcessPoolExecutor
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    import download_engine as engine  # noqa: E402
+except ImportError as e:
+    sys.exit(f"benchmark.py needs the downloader's dependencies: {e}")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+GUI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Youtube download wxpython.py")
+
+
+class MediaServer:
+    """
+    Local stand-in for the remote side:
+        /media/<name>?size=N        N synthetic bytes as video/mp4, with Range support
+        /playlist/<name>?count=N    flat playlist info dict like extract_flat returns
+        /hls/<name>/index.m3u8?segments=N&size=S&latency=MS
+                                    HLS media playlist of N segments of S bytes, each
+                                    answered after MS ms like a CDN edge far away
+    """
+    def __init__(self, default_size: int = 2 * 1024 * 1024):
+        self.default_size = default_size
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # a cancelled or rate limited download hung up mid-body
+
+            def _query(self):
+                path, _, query = self.path.partition("?")
+                params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+                return path, params
+
+            def _send_media(self, head: bool):
+                path, params = self._query()
+                size = int(params.get("size", server.default_size))
+                start, end = 0, size - 1
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2) or end)
+                self.send_response(206 if match else 200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if match:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.end_headers()
+                if head:
+                    return
+                chunk = bytes(range(256)) * 256  # 64 KiB
+                remaining, offset = end - start + 1, start
+                while remaining > 0:
+                    piece = chunk[offset % 256:][:remaining] if offset % 256 else chunk[:remaining]
+                    self.wfile.write(piece)
+                    remaining -= len(piece)
+                    offset += len(piece)
+
+            def do_HEAD(self):
+                if self.path.startswith("/media/"):
+                    self._send_media(head=True)
+                else:
+                    self.send_error(404)
+
+            def _send_hls(self):
+                path, params = self._query()
+                size, latency = int(params.get("size", 256 * 1024)), int(params.get("latency", 50))
+                if path.endswith(".m3u8"):
+                    body = server.hls_playlist(int(params.get("segments", 20)), size, latency).encode()
+                    content_type = "application/vnd.apple.mpegurl"
+                else:
+                    time.sleep(latency / 1000)
+                    body = (bytes(range(256)) * (size // 256 + 1))[:size]
+                    content_type = "video/mp2t"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/media/"):
+                    self._send_media(head=False)
+                elif self.path.startswith("/hls/"):
+                    self._send_hls()
+                elif self.path.startswith("/playlist/"):
+                    path, params = self._query()
+                    body = json.dumps(server.playlist(path.rsplit("/", 1)[-1], int(params.get("count", 100)))).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_error(404)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @staticmethod
+    def playlist(name: str, count: int) -> dict:
+        return {
+            '_type': 'playlist', 'id': name, 'title': f"Playlist {name}",
+            'webpage_url': f"https://www.youtube.com/playlist?list={name}",
+            'entries': [{'_type': 'url', 'ie_key': 'Youtube', 'id': f"{name}{i:07d}",
+                         'url': f"https://www.youtube.com/watch?v={name}{i:07d}",
+                         'title': f"Synthetic video {i} of {name}", 'duration': 60 + i % 3600,
+                         'channel': f"Channel {name}", 'view_count': i * 37}
+                        for i in range(count)],
+        }
+
+    @staticmethod
+    def flat_entry(name: str, i: int) -> dict:
+        # the fields yt-dlp's YouTube tab extractor really returns for each flat entry
+        video_id = f"{name}{i:07d}"[-11:]
+        channel_id = f"UC{name}{i % 7:020d}"[:24]
+        return {
+            '_type': 'url', 'ie_key': 'Youtube', 'id': video_id,
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': f"Synthetic video {i} of {name} - a long enough title like the real ones",
+            'description': None, 'duration': 60 + i % 3600, 'channel_id': channel_id,
+            'channel': f"Channel {name} {i % 7}", 'channel_url': f"https://www.youtube.com/channel/{channel_id}",
+            'uploader': f"Channel {name} {i % 7}", 'uploader_id': f"@channel{name}{i % 7}",
+            'uploader_url': f"https://www.youtube.com/@channel{name}{i % 7}",
+            'thumbnails': [{'url': f"https://i.ytimg.com/vi/{video_id}/{kind}.jpg?sqp=-oaymwEbCKgBEF5IVfKriqkDDggBFQAAiEIYAXABwAEG&rs=AOn4CLB{i:08d}",
+                            'height': h, 'width': w} for kind, w, h in (("hqdefault", 168, 94), ("hqdefault", 196, 110),
+                                                                         ("hqdefault", 246, 138), ("hqdefault", 336, 188))],
+            'timestamp': None, 'release_timestamp': None, 'availability': None, 'view_count': i * 37,
+            'live_status': None, 'channel_is_verified': None, '__x_forwarded_for_ip': None,
+        }
+
+    @staticmethod
+    def hls_playlist(segments: int, size: int, latency: int) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(segments):
+            lines += ["#EXTINF:4.0,", f"seg{i}.ts?size={size}&latency={latency}"]
+        return "\n".join(lines + ["#EXT-X-ENDLIST", ""])
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def percentiles(samples: list) -> dict:
+    """p50/p95/p99/max of latencies given in seconds, reported in ms."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'p50_ms': round(pick(0.50), 4), 'p95_ms': round(pick(0.95), 4),
+            'p99_ms': round(pick(0.99), 4), 'max_ms': round(ordered[-1] * 1000, 4)}
+
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except (ImportError, AttributeError):
+            return None
+
+
+def load_gui_module():
+    # the GUI script has spaces in its name, so it is loaded by path
+    spec = importlib.util.spec_from_file_location("youtube_download_wxpython", GUI_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_library(server, size: int = 100_000) -> dict:
+    library = engine.MediaLibrary()
+    urls = [f"https://www.youtube.com/watch?v=vid{i:07d}" for i in range(size)]
+    start = time.perf_counter()
+    for i, url in enumerate(urls):
+        library.add_entry(url, f"Lecture {i} on topic {i % 997} part {i % 13}", "/videos", i % 10 == 0)
+    insert_time = time.perf_counter() - start
+    lookups = timed(lambda i: library.contains_url(urls[(i * 7919) % size]), 2000)
+    searches = timed(lambda i: library.find_by_title(f"topic {i % 997} part"), 200)
+    # what add_entry/find_by_url did before the indexes: a list scan per call
+    naive = timed(lambda i: urls[(i * 7919) % size] in [e.url for e in library.entries], 20)
+    return {
+        'entries': size,
+        'insert_per_s': round(size / insert_time),
+        'lookup': percentiles(lookups),
+        'title_search': percentiles(searches),
+        'linear_scan': percentiles(naive),
+        'lookup_speedup': round(sorted(naive)[len(naive) // 2] / sorted(lookups)[len(lookups) // 2]),
+    }
+
+
+def bench_fetch(server, playlist_size: int = 2000, rounds: int = 50) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine.DownloadEngine(cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+        # extractor stub: flat info dicts come from the local server instead of yt-dlp
+        eng.extract_flat = lambda url: json.load(urlopen(url))
+        urls = [server.url(f"/playlist/PL{i:03d}?count={playlist_size}") for i in range(rounds)]
+        cold = timed(lambda i: eng.fetch(urls[i]), rounds)
+        warm = timed(lambda i: eng.fetch(urls[i]), rounds)
+        eng.shutdown()
+    return {
+        'playlist_size': playlist_size,
+        'cold_per_s': round(rounds / sum(cold), 2),
+        'cold': percentiles(cold),
+        'cached_per_s': round(rounds / sum(warm), 2),
+        'cached': percentiles(warm),
+    }
+
+
+def bench_grid(server, sizes=(100, 1000, 5000)) -> dict:
+    import wx
+    gui = load_gui_module()
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    grid = wx.grid.Grid(frame)
+    table = gui.VideoGridTable(set(), engine.ProgressTable())
+    grid.SetTable(table, takeOwnership=True)
+    results = {}
+    for size in sizes:
+        videos = MediaServer.playlist("GRID", size)['entries']
+        samples = timed(lambda i: (table.set_videos([]), table.set_videos(videos), grid.ForceRefresh(), wx.Yield()), 5)
+        results[f"rows_{size}"] = percentiles(samples)
+    frame.Destroy()
+    app.Destroy()
+    return results
+
+
+def flood_progress(eng, jobs: int, run) -> tuple:
+    # one thread per job emits progress events as fast as yt-dlp can call its hook while run() blocks
+    go, stop = threading.Event(), threading.Event()
+    events = [0] * jobs
+
+    def flood(job):
+        done = 0
+        go.wait()  # 32 busy threads would starve the start() of the others
+        while not stop.is_set():
+            done += 1024
+            eng.emit('progress', job_id=job, url="", downloaded_bytes=done, total_bytes=10 ** 9, speed=done, eta=job)
+            events[job] += 1
+
+    threads = [threading.Thread(target=flood, args=(job,)) for job in range(jobs)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    go.set()
+    run()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(events), time.perf_counter() - start
+
+
+def bench_progress(server, jobs: int = 32, seconds: float = 2.0, fps: int = 10) -> dict:
+    # ProgressTable coalescing only: a plain thread stands in for the frame's timer, which drains the
+    # table at fps and repaints each changed row; progress_ui drives the frame's own handlers
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine.DownloadEngine(cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+        table = engine.ProgressTable()
+        eng.subscribe(lambda event, data: event == 'progress' and table.update(
+            data['job_id'], engine.format_percent(data['downloaded_bytes'], data['total_bytes']),
+            engine.format_speed(data['speed']), engine.seconds_to_time(data['eta'])))
+        stop = threading.Event()
+        drains, changes, last = [], [], {}
+
+        def timer():
+            while not stop.wait(1 / fps):
+                changed = table.drain()
+                drains.append(time.perf_counter())
+                changes.append(len(changed))
+                last.update(changed)
+
+        thread = threading.Thread(target=timer)
+        thread.start()
+        events, wall = flood_progress(eng, jobs, lambda: time.sleep(seconds))
+        stop.set()
+        thread.join()
+        last.update(table.drain())
+        eng.shutdown()
+    changes_per_s = (len(drains) + sum(changes)) / wall
+    # bounded by the drain rate and the number of rows, however fast the events come
+    assert changes_per_s <= (jobs + 1) * fps * 1.1, changes_per_s
+    assert len(last) == jobs and all(snap['eta'] == engine.seconds_to_time(job) for job, snap in last.items())
+    return {
+        'jobs': jobs, 'fps': fps,
+        'events_per_s': round(events / wall),
+        'drained_hz': round(changes_per_s),  # drains plus changed rows handed out; lower is better
+        'coalescing': round(events / (len(drains) + sum(changes))),
+    }
+
+
+def bench_progress_ui(server, jobs: int = 32, seconds: float = 2.0) -> dict:
+    # the frame's own progress path on a real grid: its engine event handler fills the ProgressTable and
+    # its on_progress_timer, fired by a wx.Timer like in the frame, repaints the changed rows
+    import wx
+    gui = load_gui_module()
+    frame_class = gui.YouTubeDownloader
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    grid = wx.grid.Grid(frame)
+    table = engine.ProgressTable()
+    grid.SetTable(gui.VideoGridTable(set(), table), takeOwnership=True)
+    grid.GetTable().set_videos(MediaServer.playlist("UI", jobs)['entries'])
+    repaints, ticks = [], []
+    refresh_block = grid.RefreshBlock
+    grid.RefreshBlock = lambda *block: (repaints.append(block[0]), refresh_block(*block))
+    # the handlers only touch these attributes of the frame, a full YouTubeDownloader would also start an engine
+    view = types.SimpleNamespace(progress=table, grid=grid, job_rows={job: job for job in range(jobs)},
+                                 flush_log=lambda: None)
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine.DownloadEngine(cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+        eng.subscribe(lambda event, data: frame_class.on_engine_event(view, event, data))
+        timer = wx.Timer(frame)
+        frame.Bind(wx.EVT_TIMER, lambda event: (ticks.append(time.perf_counter()), frame_class.on_progress_timer(view, event)),
+                   timer)
+
+        def run():
+            timer.Start(100)
+            wx.CallLater(int(seconds * 1000), app.ExitMainLoop)
+            app.MainLoop()
+            timer.Stop()
+
+        events, wall = flood_progress(eng, jobs, run)
+        eng.shutdown()
+    fps = len(ticks) / wall
+    frame.Destroy()
+    app.Destroy()
+    dispatches_per_s = (len(ticks) + len(repaints)) / wall
+    # the frame's timer runs at 10 Hz and repaints each changed row at most once per tick
+    assert dispatches_per_s <= (jobs + 1) * 10 * 1.1, dispatches_per_s
+    return {
+        'jobs': jobs, 'fps': round(fps, 1),
+        'events_per_s': round(events / wall),
+        'ui_dispatch_hz': round(dispatches_per_s),  # timer ticks plus RefreshBlock calls; lower is better
+        'coalescing': round(events / max(1, len(ticks) + len(repaints))),
+    }
+
+
+def bench_downloads(server, count: int = 40, size: int = 2 * 1024 * 1024, workers: int = 4) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine.DownloadEngine(max_workers=workers, per_host_limit=workers,
+                                    cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+        times, failures = [], []
+        eng.subscribe(lambda event, data: event == 'done' and (times if data['success'] else failures).append(data['download_time']))
+        start = time.perf_counter()
+        for i in range(count):
+            eng.submit(i, server.url(f"/media/v{i}.mp4?size={size}"), os.path.join(tmp, "out"))
+        eng.wait()
+        wall = time.perf_counter() - start
+        eng.shutdown()
+    return {
+        'jobs': count, 'workers': workers, 'failed': len(failures),
+        'jobs_per_s': round(count / wall, 2),
+        'mb_per_s': round(count * size / wall / (1024 * 1024), 2),
+        'job': percentiles(times),
+    }
+
+
+def bench_sessions(server, count: int = 60, size: int = 64 * 1024) -> dict:
+
+    def run(pooled):
+        with tempfile.TemporaryDirectory() as tmp:
+            eng = engine.DownloadEngine(max_workers=1, cache_dir=os.path.join(tmp, "cache"),
+                                        journal_path=os.path.join(tmp, "jobs.db"))
+            eng.postprocess.available = False
+            if not pooled:
+                eng.download_sessions.max_idle = 0  # every job builds and closes its own YoutubeDL
+            times = []
+            eng.subscribe(lambda event, data: event == 'done' and data['success'] and times.append(data['download_time']))
+            start = time.perf_counter()
+            for i in range(count):  # small files, so the per-item setup dominates
+                eng.submit(i, server.url(f"/media/{'p' if pooled else 'n'}{i}.mp4?size={size}"), os.path.join(tmp, "out"))
+            eng.wait()
+            wall = time.perf_counter() - start
+            eng.shutdown()
+        return {'failed': count - len(times), 'items_per_s': round(count / wall, 2),
+                'per_item_ms': round(wall / count * 1000, 2), 'job': percentiles(times)}
+
+    fresh, pooled = run(False), run(True)
+    return {
+        'jobs': count, 'without_pool': fresh, 'with_pool': pooled,
+        'speedup': round(fresh['per_item_ms'] / pooled['per_item_ms'], 2),
+    }
+
+
+def bench_limiter(server, rate: int = 4 * 1024 * 1024, weights=(1, 1, 2), window: float = 3.0) -> dict:
+
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine.DownloadEngine(max_workers=len(weights), per_host_limit=len(weights), rate_limit=rate,
+                                    cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+        eng.postprocess.available = False
+        received = {}
+        eng.subscribe(lambda event, data: event == 'progress' and received.__setitem__(data['job_id'], data['downloaded_bytes']))
+
+        def measure():
+            # bytes per job over one window, once start-up and the one-second bursts are over
+            time.sleep(2)
+            before, start = dict(received), time.perf_counter()
+            time.sleep(window)
+            seconds = time.perf_counter() - start
+            return {job: (received.get(job, 0) - before.get(job, 0)) / seconds for job in received}
+
+        size = rate * 4 * (len(weights) + 2)  # big enough that no job finishes while measured
+        for job, weight in enumerate(weights):
+            eng.submit(job, server.url(f"/media/limit{job}.mp4?size={size}"), os.path.join(tmp, "out"), weight=weight)
+        shared = measure()
+        # the heaviest job stops: its share must go to the others
+        heaviest = max(range(len(weights)), key=lambda job: weights[job])
+        eng.cancel(heaviest)
+        rest = {job: speed for job, speed in measure().items() if job != heaviest}
+        eng.shutdown()
+
+    total, rest_total = sum(shared.values()), sum(rest.values())
+    split = {str(job): round(speed / total, 3) for job, speed in sorted(shared.items())}
+    expected = {str(job): round(weight / sum(weights), 3) for job, weight in enumerate(weights)}
+    assert abs(total / rate - 1) < 0.2, f"aggregate {total:.0f} B/s against a cap of {rate} B/s"
+    assert all(abs(split[job] - expected[job]) < 0.05 for job in expected), (split, expected)
+    assert abs(rest_total / rate - 1) < 0.2, f"after the heaviest job stopped: {rest_total:.0f} B/s"
+    return {
+        'cap_mb_per_s': round(rate / 2 ** 20, 2),
+        'aggregate_mb_per_s': round(total / 2 ** 20, 2),
+        'split': split, 'expected_split': expected,
+        'after_cancel_mb_per_s': round(rest_total / 2 ** 20, 2),
+    }
+
+
+def bench_fragments(server, jobs: int = 8, segments: int = 40, size: int = 128 * 1024, latency: int = 50) -> dict:
+
+    def run(tuner):
+        with tempfile.TemporaryDirectory() as tmp:
+            eng = engine.DownloadEngine(max_workers=1, cache_dir=os.path.join(tmp, "cache"),
+                                        journal_path=os.path.join(tmp, "jobs.db"))
+            eng.fragments = tuner
+            eng.postprocess.available = False  # measure the transfer only
+            times, levels = [], []
+            eng.subscribe(lambda event, data: event == 'done' and data['success'] and times.append(data['download_time']))
+            start = time.perf_counter()
+            for i in range(jobs):  # one at a time, so each job sees the level the previous ones tuned
+                levels.append(tuner.level)
+                eng.submit(i, server.url(f"/hls/s{i}/index.m3u8?segments={segments}&size={size}&latency={latency}"),
+                           os.path.join(tmp, "out", str(i)))  # every stream is titled "index"
+                eng.wait()
+            wall = time.perf_counter() - start
+            eng.shutdown()
+        return {'failed': jobs - len(times), 'mb_per_s': round(jobs * segments * size / wall / (1024 * 1024), 2),
+                'job': percentiles(times), 'levels': ",".join(map(str, levels))}
+
+    fixed = run(engine.FragmentTuner(max_level=1, start_level=1))
+    adaptive = run(engine.FragmentTuner())
+    return {
+        'jobs': jobs, 'segments': segments, 'segment_kb': size // 1024, 'latency_ms': latency,
+        'sequential': fixed, 'adaptive': adaptive,
+        'speedup': round(adaptive['mb_per_s'] / fixed['mb_per_s'], 2) if fixed['mb_per_s'] else None,
+    }
+
+
+def bench_isolation(server, count: int = 16, size: int = 8 * 1024 * 1024, workers: int = 4) -> dict:
+
+    def run(isolate):
+        lags, stop = [], threading.Event()
+
+        def ui_loop():
+            # stands in for the wx main loop: how late does a 10 ms timer fire while downloads run?
+            while not stop.is_set():
+                start = time.perf_counter()
+                time.sleep(0.01)
+                lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            eng = engine.DownloadEngine(max_workers=workers, per_host_limit=workers, isolate=isolate,
+                                        cache_dir=os.path.join(tmp, "cache"), journal_path=os.path.join(tmp, "jobs.db"))
+            eng.postprocess.available = False
+            failures = []
+            eng.subscribe(lambda event, data: event == 'done' and not data['success'] and failures.append(data['url']))
+            ui = threading.Thread(target=ui_loop, daemon=True)
+            ui.start()
+            start = time.perf_counter()
+            for i in range(count):
+                eng.submit(i, server.url(f"/media/{'p' if isolate else 't'}{i}.mp4?size={size}"), os.path.join(tmp, "out"))
+            eng.wait()
+            wall = time.perf_counter() - start
+            stop.set()
+            ui.join()
+            eng.shutdown()
+        lags.sort()
+        return {'failed': len(failures), 'mb_per_s': round(count * size / wall / (1024 * 1024), 2),
+                'ui_lag_p50_ms': round(lags[len(lags) // 2], 2), 'ui_lag_p99_ms': round(lags[int(len(lags) * 0.99)], 2)}
+
+    return {'jobs': count, 'workers': workers, 'threads': run(False), 'processes': run(True)}
+
+
+def _drain_queue(path: str, worker: str, batch: int) -> list:
+    # one queue worker process: lease and complete until nothing is left
+    queue = engine.SharedJobQueue(path)
+    completed = []
+    while True:
+        jobs = queue.lease(worker, batch)
+        if not jobs:
+            break
+        completed.extend(job['key'] for job in jobs if queue.complete(job['token'], True))
+    queue.close()
+    return completed
+
+
+def bench_queue(server, jobs: int = 5000, workers: int = 4, batch: int = 4) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.queue")
+        queue = engine.SharedJobQueue(path)
+        start = time.perf_counter()
+        queue.put_many((f"https://www.youtube.com/watch?v=Q{i:010d}", os.path.join(tmp, "out"), i + 1, None, i)
+                       for i in range(jobs))
+        put_time = time.perf_counter() - start
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = [key for keys in pool.map(_drain_queue, [path] * workers, [f"w{n}" for n in range(workers)],
+                                             [batch] * workers) for key in keys]
+        wall = time.perf_counter() - start
+        stats = queue.stats()
+        queue.close()
+    return {
+        'jobs': jobs, 'workers': workers, 'batch': batch,
+        'put_per_s': round(jobs / put_time), 'jobs_per_s': round(len(done) / wall),
+        'duplicates': len(done) - len(set(done)), 'missing': jobs - stats['done'],
+    }
+
+
+def bench_memory(server, sizes=(1000, 5000, 20000)) -> dict:
+    def retained(build):
+        # bytes still allocated once build()'s result is the only thing kept
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return kept, after - before
+
+    results = {}
+    for size in sizes:
+        payload = json.dumps({'_type': 'playlist', 'id': 'MEM', 'title': "Playlist MEM",
+                              'entries': [MediaServer.flat_entry("MEM", i) for i in range(size)]})
+        full, full_bytes = retained(lambda: json.loads(payload)['entries'])
+        slim, slim_bytes = retained(lambda: engine.MetadataCache.slim(json.loads(payload))['entries'])
+        records, record_bytes = retained(lambda: engine.video_records(json.loads(payload)))
+        assert len(full) == len(slim) == len(records) == size
+        results[f"entries_{size}"] = {
+            'full_dicts_mb': round(full_bytes / 2 ** 20, 2),
+            'slim_dicts_mb': round(slim_bytes / 2 ** 20, 2),
+            'records_mb': round(record_bytes / 2 ** 20, 2),
+            'record_bytes_per_entry': round(record_bytes / size),
+            'reduction': round(full_bytes / record_bytes, 1),
+        }
+    return results
+
+
+SCENARIOS = {
+    'library': bench_library,
+    'fetch': bench_fetch,
+    'grid': bench_grid,
+    'progress': bench_progress,
+    'progress_ui': bench_progress_ui,
+    'downloads': bench_downloads,
+    'sessions': bench_sessions,
+    'limiter': bench_limiter,
+    'fragments': bench_fragments,
+    'isolation': bench_isolation,
+    'queue': bench_queue,
+    'memory': bench_memory,
+}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Metrics more than tolerance worse than the baseline."""
+    regressions = []
+    old = flatten(baseline)
+    for key, value in flatten(results).items():
+        before = old.get(key)
+        if not before or key.endswith(("entries", "jobs", "workers", "playlist_size", "segments", "segment_kb",
+                                       "latency_ms", "failed", "batch", "fps")):
+            continue
+        higher_is_better = key.endswith(("_per_s", "speedup", "reduction", "coalescing"))
+        change = (value - before) / before
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{key}: {before} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the YouTube downloader.")
+    parser.add_argument("--only", help="comma separated scenarios: " + ",".join(SCENARIOS))
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: benchmark_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline, exit 1 on regressions")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    results = {}
+    with MediaServer() as server:
+        for name in names:
+            try:
+                start = time.perf_counter()
+                results[name] = SCENARIOS[name](server)
+                results[name]['seconds'] = round(time.perf_counter() - start, 2)
+            except ImportError as e:
+                print(f"{name}: skipped ({e})")
+                continue
+            results[name]['peak_rss_mb'] = peak_rss_mb()
+            print(f"{name}: {json.dumps(results[name], indent=2)}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        for line in regressions:
+            print("REGRESSION " + line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2773 @@
+"""
+GUI-independent fetch and download engine for the YouTube downloader.
+
+The wx frame and the command line entry point both drive a DownloadEngine and
+subscribe to its events; nothing in here imports wx.
+
+    python download_engine.py urls.txt -o downloads -j 4
+    python download_engine.py library.ydl -o downloads -j 8 --per-host 4
+    python download_engine.py library.ydl -o /shared/downloads --queue /shared/jobs.queue   # add to a shared queue
+    python download_engine.py --queue /shared/jobs.queue -j 4                                # one headless worker
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from urllib.request import Request, urlopen
+
+import yt_dlp
+
+
+class MediaEntry:
+    __slots__ = ('url', 'title', 'file_path', 'is_playlist')
+
+    def __init__(self, url: str, title: str, file_path: str, is_playlist: bool):
+        self.url = url
+        self.title = title
+        self.file_path = file_path
+        self.is_playlist = is_playlist
+
+    def __repr__(self):
+        return (f"MediaEntry(title='{self.title}', url='{self.url}', "
+                f"path='{self.file_path}', playlist={self.is_playlist})")
+    def __str__(self):
+        return f"{self.title}|{self.url}|{self.file_path}|{int(self.is_playlist)}"
+    def to_csv_line(self):
+        # csv quoting keeps titles with commas in one field
+        out = io.StringIO()
+        csv.writer(out, lineterminator="").writerow([self.title, self.url, self.file_path, int(self.is_playlist)])
+        return out.getvalue()
+    @staticmethod
+    def from_csv_line(line: str):
+        parts = next(csv.reader([line.strip()]), [])
+        if len(parts) > 4:
+            # older files wrote titles unquoted, so extra commas belong to the title
+            parts = [",".join(parts[:-3])] + parts[-3:]
+        if len(parts) == 4:
+            title, url, file_path, is_playlist = parts
+            try:
+                return MediaEntry(url, title, file_path, bool(int(is_playlist)))
+            except ValueError:
+                return None
+        return None
+    @staticmethod
+    def from_string(line: str):
+        parts = line.strip().split("|")
+        if len(parts) == 4:
+            title, url, file_path, is_playlist = parts
+            return MediaEntry(url, title, file_path, bool(int(is_playlist)))
+        return None
+
+class VideoRecord:
+    """
+    The few fields of a playlist entry the grid, downloader and library read,
+    in a slotted object instead of yt-dlp's full info dict. Ids and channel
+    names are interned, so repeated values share one string. Supports get()
+    and [] like the dicts it replaces; anything else comes from
+    DownloadEngine.full_info() when it is actually needed.
+    """
+    __slots__ = ('id', 'title', 'channel', 'duration', 'thumbnail')
+    FIELDS = __slots__
+
+    def __init__(self, id: str, title: str = None, channel: str = None, duration=None, thumbnail: str = None):
+        self.id = sys.intern(id) if isinstance(id, str) else id
+        self.title = title
+        self.channel = sys.intern(channel) if isinstance(channel, str) else channel
+        self.duration = duration
+        self.thumbnail = thumbnail
+
+    @classmethod
+    def from_info(cls, info: dict):
+        return cls(info.get('id'), info.get('title'), info.get('channel') or info.get('uploader'),
+                   info.get('duration'), info.get('thumbnail'))
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"VideoRecord(id='{self.id}', title='{self.title}')"
+
+
+def video_records(info: dict) -> list:
+    """Compact records for the entries of a flat extraction (or the one video it describes)."""
+    entries = info['entries'] if info.get('entries') is not None else [info]
+    return [VideoRecord.from_info(e) for e in entries if e]
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL used as the library's dedupe key.
+    Scheme, "www."/"m." and trailing slashes are ignored, youtu.be links map to
+    watch URLs, and for YouTube only the v/list query parameters are kept.
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parsed.path.rstrip("/")
+    query = parse_qs(parsed.query)
+    if host == "youtu.be" and path:
+        query.setdefault("v", [path.lstrip("/")])
+        host, path = "youtube.com", "/watch"
+    if host == "youtube.com":
+        keep = [f"{k}={query[k][0]}" for k in ("v", "list") if k in query]
+        return host + path + ("?" + "&".join(keep) if keep else "")
+    return host + path + ("?" + parsed.query if parsed.query else "")
+
+
+class NgramIndex:
+    """
+    Substring search over short strings using trigram postings.
+    A query is answered from the smallest posting list of its trigrams and
+    then verified, instead of lowercasing and scanning every item.
+    """
+    N = 3
+
+    def __init__(self):
+        self._postings = {}
+        self._text = {}
+
+    def _grams(self, text: str):
+        return {text[i:i + self.N] for i in range(len(text) - self.N + 1)}
+
+    def add(self, item, text: str):
+        text = text.lower()
+        self._text[item] = text
+        for gram in self._grams(text):
+            self._postings.setdefault(gram, {})[item] = None
+
+    def remove(self, item):
+        text = self._text.pop(item, None)
+        if text is None:
+            return
+        for gram in self._grams(text):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.pop(item, None)
+                if not posting:
+                    del self._postings[gram]
+
+    def clear(self):
+        self._postings.clear()
+        self._text.clear()
+
+    def search(self, keyword: str) -> list:
+        keyword = keyword.lower()
+        if len(keyword) < self.N:
+            # too short to use the postings
+            return [item for item, text in self._text.items() if keyword in text]
+        postings = []
+        for gram in self._grams(keyword):
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        smallest = min(postings, key=len)
+        return [item for item in smallest if keyword in self._text[item]]
+
+
+class MediaLibrary:
+    def __init__(self):
+        self.entries = []
+        self._by_url = {}
+        self._title_index = NgramIndex()
+        self._url_index = NgramIndex()
+        self._order = {}
+        self._seq = itertools.count()
+        self.store = None  # LibraryStore once the library is opened from or saved to a .ydl
+
+    def _index(self, entry: MediaEntry, persist: bool = False):
+        self.entries.append(entry)
+        self._order[entry] = next(self._seq)
+        self._by_url[normalize_url(entry.url)] = entry
+        self._title_index.add(entry, entry.title or "")
+        self._url_index.add(entry, entry.url)
+        if persist and self.store is not None:
+            self.store.add(entry)
+
+    def add_entry(self, url: str, title: str, file_path: str, is_playlist: bool):
+        """Add an entry; returns None if the URL is already in the library."""
+        if self.contains_url(url):
+            return None  # Avoid duplicates
+        entry = MediaEntry(url, title, file_path, is_playlist)
+        self._index(entry, persist=True)
+        return entry
+
+    def delete_entry(self, index: int):
+        entry = self.entries.pop(index)
+        self._order.pop(entry, None)
+        self._by_url.pop(normalize_url(entry.url), None)
+        self._title_index.remove(entry)
+        self._url_index.remove(entry)
+        if self.store is not None:
+            self.store.delete(entry)
+
+    def clear(self):
+        self.entries.clear()
+        self._order.clear()
+        self._by_url.clear()
+        self._title_index.clear()
+        self._url_index.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def get_all(self):
+        return self.entries
+    
+    def get_by_indx(self, index):
+        return self.entries[index]
+
+    def get_by_url(self, url: str):
+        return self._by_url.get(normalize_url(url))
+
+    def contains_url(self, url: str) -> bool:
+        return normalize_url(url) in self._by_url
+    
+    def find_by_title(self, keyword: str):
+        return self._sorted(self._title_index.search(keyword))
+    
+    def find_by_url(self, keyword: str):
+        return self._sorted(self._url_index.search(keyword))
+
+    def _sorted(self, found):
+        # postings don't keep library order once entries are deleted and re-added
+        return sorted(found, key=self._order.__getitem__)
+
+    def find_playlists(self):
+        return [e for e in self.entries if e.is_playlist]
+
+    def __repr__(self):
+        return f"MediaLibrary({len(self.entries)} entries)"
+    def save_to_csv(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("Title,URL,FilePath,IsPlaylist\n")
+            for entry in self.entries:
+                f.write(entry.to_csv_line() + "\n")
+
+    def load_from_csv(self, path):
+        self.detach()
+        self.clear()
+        with open(path, 'r', encoding='utf-8') as f:
+            next(f, None)  # Skip header
+            for line in f:
+                entry = MediaEntry.from_csv_line(line)
+                if entry and not self.contains_url(entry.url):
+                    self._index(entry)
+
+    def detach(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def open(self, path):
+        """Open a .ydl library; older CSV files are read as before."""
+        if not LibraryStore.is_store(path):
+            self.load_from_csv(path)  # saved as SQLite on the next save
+            return
+        self.detach()
+        self.clear()
+        self.store = LibraryStore(path)
+        for entry in self.store.iter_entries():
+            self._index(entry)
+
+    def save(self, path):
+        """Write the library to path and keep saving changes there incrementally."""
+        if self.store is not None and os.path.abspath(self.store.path) == os.path.abspath(path):
+            return  # every change is already committed
+        self.detach()
+        tmp = path + ".tmp"
+        for stale in (tmp, tmp + "-wal", tmp + "-shm"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        store = LibraryStore(tmp)
+        store.replace_all(self.entries)
+        store.conn.execute("PRAGMA journal_mode=DELETE")  # fold the WAL back before the rename
+        store.close()
+        os.replace(tmp, path)
+        self.store = LibraryStore(path)
+
+class LibraryStore:
+    """
+    SQLite (WAL mode) backing file for a MediaLibrary. Every add, delete and
+    clear is its own small transaction, so the library is saved as it changes
+    instead of being rewritten on each save.
+    """
+    MAGIC = b"SQLite format 3\x00"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                          "url_key TEXT PRIMARY KEY, title TEXT, url TEXT, "
+                          "file_path TEXT, is_playlist INTEGER)")
+        self.conn.commit()
+
+    @classmethod
+    def is_store(cls, path: str) -> bool:
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(cls.MAGIC)) == cls.MAGIC
+        except OSError:
+            return False
+
+    def _row(self, entry: MediaEntry):
+        return (normalize_url(entry.url), entry.title, entry.url, entry.file_path, int(entry.is_playlist))
+
+    def add(self, entry: MediaEntry):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", self._row(entry))
+
+    def delete(self, entry: MediaEntry):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE url_key = ?", (normalize_url(entry.url),))
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries")
+
+    def replace_all(self, entries):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                  (self._row(e) for e in entries))
+
+    def iter_entries(self):
+        # the cursor streams rows, nothing is read into memory up front
+        cursor = self.conn.execute("SELECT title, url, file_path, is_playlist FROM entries ORDER BY rowid")
+        for title, url, file_path, is_playlist in cursor:
+            yield MediaEntry(url, title, file_path, bool(is_playlist))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+# Example usage
+#library = MediaLibrary()
+#library.add_entry("https://example.com/video1", "Intro to Python", "/videos/python_intro.mp4", False)
+#library.add_entry("https://example.com/playlist1", "Python Tutorials", "/videos/python_playlist.m3u", True)
+
+
+class MetadataCache:
+    """
+    On-disk cache of flat extraction results, one JSON file per normalized URL.
+    Entries older than ttl seconds are returned as stale so the caller can show
+    them right away and revalidate; a fingerprint of the entry ids tells whether
+    the revalidated result actually changed. Least recently used files are
+    evicted once there are more than max_entries.
+    """
+    # bulky per-video fields that the grid and downloader never read
+    DROP_KEYS = ('formats', 'requested_formats', 'thumbnails', 'subtitles',
+                 'automatic_captions', 'heatmap', 'chapters', 'description')
+
+    def __init__(self, directory: str, ttl: float = 6 * 3600, max_entries: int = 500):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._count = sum(1 for name in os.listdir(directory) if name.endswith(".json"))
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    @staticmethod
+    def fingerprint(info: dict) -> str:
+        ids = [e.get('id') or e.get('url') or "" for e in info.get('entries') or [info]]
+        return hashlib.sha1("\n".join(map(str, ids)).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def slim(cls, info: dict) -> dict:
+        info = {k: v for k, v in info.items() if k not in cls.DROP_KEYS}
+        if info.get('entries') is not None:
+            info['entries'] = [{k: v for k, v in e.items() if k not in cls.DROP_KEYS}
+                               for e in info['entries'] if e]
+        return info
+
+    def get(self, url: str):
+        """Return (info, is_fresh), or (None, False) on a miss."""
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            os.utime(path)  # mtime doubles as the LRU clock
+        except (OSError, ValueError):
+            return None, False
+        return record['info'], time.time() - record['fetched_at'] < self.ttl
+
+    def put(self, url: str, info: dict) -> bool:
+        """Store a fresh extraction; returns False if it matches the cached fingerprint."""
+        info = self.slim(info)
+        record = {'url': url, 'fetched_at': time.time(),
+                  'fingerprint': self.fingerprint(info), 'info': info}
+        path = self._path(url)
+        with self._lock:
+            changed, existed = True, os.path.exists(path)
+            if existed:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        changed = json.load(f).get('fingerprint') != record['fingerprint']
+                except (OSError, ValueError):
+                    pass
+            tmp = path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp, path)
+            if not existed:
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._evict()
+        return changed
+
+    def _evict(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+        files.sort(key=lambda f: os.path.getmtime(f))
+        for f in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        self._count = min(len(files), self.max_entries)
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of thumbnail images, one file per video id. load() is
+    blocking (disk, then network) and meant for worker threads; files are
+    written through a temp name so a reader never sees half an image. The
+    least recently used files go once there are more than max_files.
+    """
+    def __init__(self, directory: str, max_files: int = 5000, timeout: float = 10):
+        self.directory = directory
+        self.max_files = max_files
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._count = sum(1 for name in os.listdir(directory) if name.endswith(".jpg"))
+
+    @staticmethod
+    def url(video: dict) -> str:
+        # mqdefault is 320x180, the size the preview shows; flat entries don't keep their thumbnail list
+        return video.get('thumbnail') or f"https://i.ytimg.com/vi/{video['id']}/mqdefault.jpg"
+
+    def _path(self, video_id: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in video_id)
+        return os.path.join(self.directory, safe + ".jpg")
+
+    def load(self, video: dict) -> bytes:
+        path = self._path(video['id'])
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as the LRU clock
+            return data
+        except OSError:
+            pass
+        with urlopen(Request(self.url(video), headers={'User-Agent': 'Mozilla/5.0'}), timeout=self.timeout) as response:
+            data = response.read()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._count += 1
+            if self._count > self.max_files:
+                self._evict()
+        return data
+
+    def _evict(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".jpg")]
+        files.sort(key=lambda f: os.path.getmtime(f))
+        for f in files[:len(files) - self.max_files]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        self._count = min(len(files), self.max_files)
+
+
+class JobJournal:
+    """
+    Crash-safe record of every download job (SQLite, WAL mode), one row per
+    video and target folder. States go queued -> downloading -> postprocessing
+    -> done | failed | cancelled; byte counts are written from the progress hook
+    at most once per write_interval seconds per job. After a crash the jobs
+    that never reached a final state are returned by pending() to be queued
+    again, and yt-dlp picks up their .part files.
+    """
+    FINAL_STATES = ("done", "failed", "cancelled")
+
+    def __init__(self, path: str, write_interval: float = 1.0):
+        self.path = path
+        self.write_interval = write_interval
+        self._last_write = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                          "job_key TEXT PRIMARY KEY, url TEXT, output_path TEXT, playlist_index INTEGER, "
+                          "state TEXT, downloaded_bytes INTEGER DEFAULT 0, total_bytes INTEGER, "
+                          "message TEXT, updated_at REAL, entry_url TEXT)")
+        if "entry_url" not in [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN entry_url TEXT")  # journals from before the archive
+        self.conn.commit()
+
+    @staticmethod
+    def key(url: str, output_path: str) -> str:
+        return normalize_url(url) + "|" + os.path.abspath(output_path)
+
+    def state(self, key: str):
+        with self._lock:
+            row = self.conn.execute("SELECT state FROM jobs WHERE job_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def done_keys(self, keys) -> set:
+        keys, found = list(keys), set()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                found.update(k for (k,) in self.conn.execute(
+                    f"SELECT job_key FROM jobs WHERE state = 'done' AND job_key IN ({marks})", chunk))
+        return found
+
+    def queued(self, url: str, output_path: str, playlist_index: int = None, entry_url: str = None):
+        key = self.key(url, output_path)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO jobs (job_key, url, output_path, playlist_index, state, updated_at, entry_url) "
+                              "VALUES (?, ?, ?, ?, 'queued', ?, ?) ON CONFLICT(job_key) DO UPDATE SET "
+                              "state = 'queued', message = NULL, updated_at = excluded.updated_at, "
+                              "entry_url = excluded.entry_url",
+                              (key, url, output_path, playlist_index, time.time(), entry_url))
+        return key
+
+    def set_state(self, key: str, state: str, message: str = None):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE jobs SET state = ?, message = ?, updated_at = ? WHERE job_key = ?",
+                              (state, message, time.time(), key))
+            self._last_write.pop(key, None)
+
+    def progress(self, key: str, downloaded_bytes, total_bytes):
+        now = time.monotonic()
+        with self._lock, self.conn:
+            if now - self._last_write.get(key, 0) < self.write_interval:
+                return
+            self._last_write[key] = now
+            self.conn.execute("UPDATE jobs SET state = 'downloading', downloaded_bytes = ?, total_bytes = ?, "
+                              "updated_at = ? WHERE job_key = ?",
+                              (downloaded_bytes or 0, total_bytes, time.time(), key))
+
+    def pending(self) -> list:
+        """Jobs that were queued or in progress when the last session ended."""
+        with self._lock:
+            rows = self.conn.execute("SELECT url, output_path, playlist_index, state, downloaded_bytes, entry_url FROM jobs "
+                                     "WHERE state NOT IN ('done', 'failed', 'cancelled') ORDER BY updated_at").fetchall()
+        return [{'url': url, 'output_path': path, 'playlist_index': index, 'state': state, 'downloaded_bytes': done,
+                 'entry_url': entry_url}
+                for url, path, index, state, done, entry_url in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class DownloadArchive:
+    """
+    Indexed record of every video id that has been downloaded, with the file
+    it ended up in, plus which library entries (playlist or video URLs) each
+    id belongs to. Both tables are keyed B-trees, so membership checks stay
+    logarithmic however many ids and playlists the archive holds.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS videos ("
+                          "video_id TEXT PRIMARY KEY, filepath TEXT, downloaded_at REAL) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS members ("
+                          "entry_url TEXT, video_id TEXT, PRIMARY KEY (entry_url, video_id)) WITHOUT ROWID")
+        self.conn.commit()
+
+    def add(self, video_id: str, filepath: str = None, entry_url: str = None):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO videos (video_id, filepath, downloaded_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT(video_id) DO UPDATE SET filepath = excluded.filepath, "
+                              "downloaded_at = excluded.downloaded_at", (video_id, filepath, time.time()))
+            if entry_url:
+                self.conn.execute("INSERT OR IGNORE INTO members VALUES (?, ?)", (normalize_url(entry_url), video_id))
+
+    def link(self, entry_url: str, video_ids):
+        """Record video_ids as members of the library entry entry_url."""
+        entry_url = normalize_url(entry_url)
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO members VALUES (?, ?)", ((entry_url, v) for v in video_ids))
+
+    def lookup(self, video_ids) -> dict:
+        """{video_id: filepath} for the ids that are in the archive."""
+        video_ids, found = list(video_ids), {}
+        with self._lock:
+            for i in range(0, len(video_ids), 500):
+                chunk = video_ids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                found.update(self.conn.execute(
+                    f"SELECT video_id, filepath FROM videos WHERE video_id IN ({marks})", chunk))
+        return found
+
+    def missing(self, video_ids, check_files: bool = True) -> set:
+        """Ids never downloaded, or (with check_files) whose file is gone from disk."""
+        found = self.lookup(video_ids)
+        return {v for v in video_ids
+                if v not in found or check_files and found[v] and not os.path.exists(found[v])}
+
+    def entry_ids(self, entry_url: str) -> set:
+        with self._lock:
+            return {v for (v,) in self.conn.execute("SELECT video_id FROM members WHERE entry_url = ?",
+                                                    (normalize_url(entry_url),))}
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class ContentStore:
+    """
+    One copy of each (video id, format) on disk. The first download lands in
+    its own folder under the usual name and is recorded as the canonical copy;
+    any later request for the same video, from whatever playlist, gets a
+    hardlink to it (symlink, then copy, where links are not possible) named
+    the usual way in its own folder. Requests that arrive while the video is
+    still downloading wait for that download instead of starting another.
+    """
+    class _Flight:
+        def __init__(self):
+            self.done = threading.Event()
+            self.followers = []  # callbacks for when the download is over, see follow()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight of the download in progress
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS content ("
+                          "video_id TEXT, format TEXT, filepath TEXT, title TEXT, stored_at REAL, "
+                          "PRIMARY KEY (video_id, format)) WITHOUT ROWID")
+        self.conn.commit()
+
+    def find(self, key: tuple):
+        """(filepath, title) of the canonical copy for key = (video_id, format), None if missing."""
+        with self._lock:
+            row = self.conn.execute("SELECT filepath, title FROM content WHERE video_id = ? AND format = ?", key).fetchone()
+        return row if row and os.path.exists(row[0]) else None
+
+    def put(self, key: tuple, filepath: str, title: str):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?)",
+                              (*key, os.path.abspath(filepath), title, time.time()))
+
+    def claim(self, key: tuple):
+        """Returns (flight, True) for the caller that should download key, (flight, False) for callers that should wait on it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = self._Flight()
+            return flight, True
+
+    def follow(self, flight, callback):
+        """Call callback() once flight is over, right away if it already is."""
+        with self._lock:
+            if not flight.done.is_set():
+                flight.followers.append(callback)
+                return
+        callback()
+
+    def release(self, key: tuple):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+            if flight is None:
+                return
+            flight.done.set()
+            followers, flight.followers = flight.followers, []
+        for callback in followers:
+            callback()
+
+    @staticmethod
+    def link(source: str, dest: str) -> str:
+        """Place source at dest as a hardlink, symlink or copy; an existing dest is left alone."""
+        if os.path.exists(dest):
+            return dest
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        try:
+            os.link(source, dest)
+        except OSError:  # other drive, FAT, ...
+            try:
+                os.symlink(os.path.abspath(source), dest)
+            except OSError:  # no symlink rights on Windows
+                shutil.copy2(source, dest)
+        return dest
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class SharedJobQueue:
+    """
+    Video jobs shared by download workers on one or several machines, in an
+    SQLite file on a shared volume (rollback journal, since WAL needs shared
+    memory that network file systems do not provide). A worker leases jobs
+    for lease_time seconds and renews them with heartbeat() while it
+    downloads; jobs of a worker that stops heartbeating go to the next worker
+    that asks, up to max_attempts times. Every lease has its own token and only the current
+    token can complete a job, so a worker that lost its lease cannot finish it
+    a second time. Lease expiry compares wall clocks, so keep the hosts in sync.
+    """
+    def __init__(self, path: str, lease_time: float = 60, max_attempts: int = 3):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit, lease() opens its own write transaction; other processes wait up to 30 s for the lock
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                          "job_key TEXT PRIMARY KEY, url TEXT, output_path TEXT, playlist_index INTEGER, "
+                          "entry_url TEXT, priority INTEGER DEFAULT 0, state TEXT, worker TEXT, token TEXT, "
+                          "lease_until REAL, attempts INTEGER DEFAULT 0, message TEXT, updated_at REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority)")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_token ON jobs (token)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, heartbeat_at REAL)")
+
+    @contextlib.contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes the file's write lock up front, so two workers never lease the same rows
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def put(self, url: str, output_path: str, playlist_index: int = None, entry_url: str = None, priority: int = 0) -> bool:
+        return self.put_many([(url, output_path, playlist_index, entry_url, priority)]) == 1
+
+    def put_many(self, jobs, force: bool = False) -> int:
+        """
+        Add (url, output_path, playlist_index, entry_url, priority) jobs; returns how many were added.
+        Jobs already queued, leased or done are left alone, failed ones (and with force done ones) are queued again.
+        """
+        now = time.time()
+        rows = [(JobJournal.key(url, output_path), url, output_path, index, entry_url, priority, now)
+                for url, output_path, index, entry_url, priority in jobs]
+        with self._write() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT INTO jobs (job_key, url, output_path, playlist_index, entry_url, priority, state, "
+                             "updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?) ON CONFLICT(job_key) DO UPDATE SET "
+                             "state = 'queued', attempts = 0, token = NULL, message = NULL, "
+                             "updated_at = excluded.updated_at WHERE state = 'failed' OR ? AND state = 'done'",
+                             [row + (force,) for row in rows])
+            return conn.total_changes - before
+
+    def put_info(self, info: dict, output_path: str, entry_url: str = None) -> int:
+        """Queue every video of a flat extraction, into the same folders DownloadEngine.submit_info uses."""
+        entries = info.get('entries')
+        if entries is None:
+            return self.put_many([(info.get('webpage_url') or watch_url(info), output_path, None, entry_url, 0)])
+        folder = os.path.join(output_path, info.get('title') or "")
+        return self.put_many((watch_url(video), folder, i + 1, entry_url, i)
+                             for i, video in enumerate(entries) if video and video.get('id'))
+
+    def lease(self, worker: str, count: int = 1) -> list:
+        """Lease up to count jobs to worker: queued ones first, then ones whose lease ran out."""
+        now = time.time()
+        with self._write() as conn:
+            conn.execute("UPDATE jobs SET state = 'failed', token = NULL, message = 'Lease expired ' || attempts || "
+                         "' times, last worker ' || worker, updated_at = ? "
+                         "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            rows = conn.execute("SELECT job_key, url, output_path, playlist_index, entry_url, attempts FROM jobs "
+                                "WHERE state = 'queued' OR state = 'leased' AND lease_until < ? "
+                                "ORDER BY state = 'leased', priority, rowid LIMIT ?", (now, count)).fetchall()
+            jobs = []
+            for key, url, output_path, index, entry_url, attempts in rows:
+                token = os.urandom(8).hex()
+                conn.execute("UPDATE jobs SET state = 'leased', worker = ?, token = ?, lease_until = ?, "
+                             "attempts = attempts + 1, updated_at = ? WHERE job_key = ?",
+                             (worker, token, now + self.lease_time, now, key))
+                jobs.append({'token': token, 'key': key, 'url': url, 'output_path': output_path,
+                             'playlist_index': index, 'entry_url': entry_url, 'attempt': attempts + 1})
+            conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (worker, now))
+        return jobs
+
+    def heartbeat(self, worker: str, tokens) -> set:
+        """Renew the leases of tokens; returns the tokens the worker still holds."""
+        tokens, now = list(tokens), time.time()
+        held = set()
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (worker, now))
+            for i in range(0, len(tokens), 500):
+                chunk = tokens[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                conn.execute(f"UPDATE jobs SET lease_until = ? WHERE state = 'leased' AND worker = ? AND token IN ({marks})",
+                             [now + self.lease_time, worker] + chunk)
+                held.update(t for (t,) in conn.execute(
+                    f"SELECT token FROM jobs WHERE state = 'leased' AND worker = ? AND token IN ({marks})", [worker] + chunk))
+        return held
+
+    def complete(self, token: str, success: bool, message: str = None) -> bool:
+        """
+        Finish a leased job; False if the lease was lost (the job belongs to another worker now).
+        A failed download is queued again for another try until max_attempts.
+        """
+        with self._write() as conn:
+            cursor = conn.execute("UPDATE jobs SET state = CASE WHEN ? THEN 'done' WHEN attempts < ? THEN 'queued' "
+                                  "ELSE 'failed' END, token = NULL, lease_until = NULL, message = ?, updated_at = ? "
+                                  "WHERE token = ? AND state = 'leased'",
+                                  (bool(success), self.max_attempts, message, time.time(), token))
+            return cursor.rowcount == 1
+
+    def release(self, tokens):
+        """Hand leased jobs back unfinished (worker shutting down), without counting an attempt."""
+        with self._write() as conn:
+            conn.executemany("UPDATE jobs SET state = 'queued', token = NULL, lease_until = NULL, "
+                             "attempts = attempts - 1 WHERE token = ? AND state = 'leased'", ((t,) for t in tokens))
+
+    def stats(self, alive: float = None) -> dict:
+        """Job counts per state, plus the workers that sent a heartbeat within alive seconds (default: lease_time)."""
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            workers = [w for (w,) in self.conn.execute("SELECT worker FROM workers WHERE heartbeat_at >= ?",
+                                                        (time.time() - (alive or self.lease_time),))]
+        return dict({state: counts.get(state, 0) for state in ("queued", "leased", "done", "failed")}, workers=workers)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by all running downloads. The total rate (bytes/s,
+    0 = unlimited) is split between the registered jobs by weight and
+    re-split whenever a job starts or finishes or a limit changes, so capacity
+    freed by finished jobs goes to the remaining ones. Jobs pay for the bytes
+    they received from their progress hook and sleep off any debt.
+    """
+    def __init__(self, rate: float = 0):
+        self.rate = rate
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.rate = max(0, rate)
+            self._rebalance()
+
+    def register(self, key, weight: float = 1.0):
+        with self._lock:
+            self._jobs[key] = {'weight': max(weight, 0.01), 'tokens': 0.0, 'stamp': time.monotonic(), 'rate': 0.0}
+            self._rebalance()
+
+    def unregister(self, key):
+        with self._lock:
+            if self._jobs.pop(key, None) is not None:
+                self._rebalance()
+
+    def set_weight(self, key, weight: float):
+        with self._lock:
+            if key in self._jobs:
+                self._jobs[key]['weight'] = max(weight, 0.01)
+                self._rebalance()
+
+    def shares(self) -> dict:
+        with self._lock:
+            return {key: bucket['rate'] for key, bucket in self._jobs.items()}
+
+    def _rebalance(self):
+        now = time.monotonic()
+        total = sum(b['weight'] for b in self._jobs.values())
+        for bucket in self._jobs.values():
+            self._refill(bucket, now)
+            bucket['rate'] = self.rate * bucket['weight'] / total if self.rate else 0.0
+
+    @staticmethod
+    def _refill(bucket, now):
+        # at most one second of burst
+        bucket['tokens'] = min(bucket['rate'], bucket['tokens'] + bucket['rate'] * (now - bucket['stamp']))
+        bucket['stamp'] = now
+
+    def consume(self, key, nbytes: int):
+        """Charge nbytes to a job, blocking while its bucket is in debt."""
+        with self._lock:
+            bucket = self._jobs.get(key)
+            if not self.rate or bucket is None:
+                return
+            self._refill(bucket, time.monotonic())
+            bucket['tokens'] -= nbytes
+        while True:
+            with self._lock:
+                if not self.rate or self._jobs.get(key) is not bucket:
+                    return  # limit lifted or job gone
+                self._refill(bucket, time.monotonic())
+                if bucket['tokens'] >= 0:
+                    return
+                # short naps so a changed rate or share applies quickly
+                delay = min(-bucket['tokens'] / bucket['rate'], 0.25)
+            time.sleep(delay)
+
+
+class FragmentTuner:
+    """
+    Chooses concurrent_fragment_downloads for each DASH/HLS job. yt-dlp fixes
+    the number when a download starts, so the tuning is across jobs: a hill
+    climb over the mean throughput finished fragmented jobs measured at each
+    level, moving up while a level beats the one below it by min_gain and
+    back down when it does not. global_cap bounds the fragment connections of
+    all running jobs together, so a lone job gets the tuned level and many
+    parallel jobs split the cap between them.
+    """
+    LEVELS = (1, 2, 3, 4, 6, 8, 12, 16)
+
+    def __init__(self, global_cap: int = 16, max_level: int = 8, start_level: int = 2, min_gain: float = 0.1,
+                 smoothing: float = 0.3):
+        self.global_cap = global_cap
+        self.levels = [n for n in self.LEVELS if n <= max_level] or [1]
+        self.level = max(n for n in self.levels if n <= start_level) if start_level >= 1 else 1
+        self.min_gain = min_gain
+        self.smoothing = smoothing
+        self.throughput = {}  # level -> smoothed bytes/s of jobs run at that level
+        self._active = {}  # job_id -> fragments granted
+        self._lock = threading.Lock()
+
+    def acquire(self, job_id) -> int:
+        with self._lock:
+            free = self.global_cap - sum(self._active.values())
+            fair = self.global_cap // (len(self._active) + 1)  # room for the jobs already running
+            granted = max(1, min(self.level, free, fair))
+            self._active[job_id] = granted
+            return granted
+
+    def release(self, job_id, nbytes: int = 0, seconds: float = 0, fragments: int = 0):
+        """Give the job's connections back; fragmented downloads also feed their throughput to the tuner."""
+        with self._lock:
+            granted = self._active.pop(job_id, None)
+            if not granted or not fragments or seconds <= 0 or not nbytes:
+                return
+            speed = nbytes / seconds
+            old = self.throughput.get(granted)
+            self.throughput[granted] = speed if old is None else old + self.smoothing * (speed - old)
+            if granted == self.level:
+                self._climb()
+
+    def _climb(self):
+        i = self.levels.index(self.level)
+        current = self.throughput[self.level]
+        below = self.throughput.get(self.levels[i - 1]) if i > 0 else None
+        above = self.throughput.get(self.levels[i + 1]) if i + 1 < len(self.levels) else None
+        if below is not None and current < below * (1 + self.min_gain):
+            self.level = self.levels[i - 1]  # more connections did not pay off
+        elif i + 1 < len(self.levels) and (above is None or above > current * (1 + self.min_gain)):
+            self.level = self.levels[i + 1]
+
+    def set_global_cap(self, cap: int):
+        with self._lock:
+            self.global_cap = max(1, cap)
+
+
+class DownloadJob:
+    """
+    One queued download. The target is called as target(*args, job=job) on a
+    scheduler worker; it should call job.checkpoint() from its progress hook so
+    pause and cancel take effect while the download is running. on_cancel(job)
+    is called instead if the job is cancelled before it started.
+    """
+    def __init__(self, job_id, url: str, target, args=(), priority: int = 0, on_cancel=None):
+        self.job_id = job_id
+        self.url = url
+        self.host = urlparse(url).hostname or ""
+        self.target = target
+        self.args = args
+        self.priority = priority
+        self.on_cancel = on_cancel
+        self.state = "queued"  # queued, paused, waiting, running, done, failed, cancelled
+        self.result = None
+        self.cancelled = False
+        self._resume = threading.Event()
+        self._resume.set()
+
+    def __repr__(self):
+        return f"DownloadJob(id={self.job_id}, state='{self.state}', url='{self.url}')"
+
+    def checkpoint(self):
+        # blocks while paused, aborts the running yt-dlp download when cancelled
+        self._resume.wait()
+        if self.cancelled:
+            raise yt_dlp.utils.DownloadCancelled(f"Job {self.job_id} cancelled")
+
+
+class Deferred:
+    """
+    Returned by a job target that cannot go on yet. The job gives its worker
+    back and waits (state 'waiting') until the callback passed to
+    register(callback) is called; then it is queued again and its target runs
+    from the start.
+    """
+    def __init__(self, register):
+        self.register = register
+
+
+class DownloadScheduler:
+    """
+    Bounded pool of download workers fed from a priority queue (lower priority
+    value first, FIFO within the same priority), with a cap on how many jobs
+    may run against the same host at once. Each host has its own heap, so a
+    worker only looks at the heads of the hosts below the cap. Only the last
+    keep_finished finished jobs stay in jobs, so a long-running worker doesn't
+    grow forever.
+    """
+    def __init__(self, max_workers: int = 4, per_host_limit: int = 3, on_change=None, keep_finished: int = 1000):
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.on_change = on_change  # called with stats() whenever a job changes state
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self._finished = deque()
+        self._waiting = set()  # jobs whose target returned a Deferred
+        self._queues = {}  # host -> heap of (priority, seq, job); paused and cancelled jobs are dropped lazily
+        self._parked = {}  # paused job -> its heap item, taken off the heap until resume()
+        self._seq = itertools.count()
+        self._host_active = {}
+        self._active = 0
+        self._workers = []
+        self._cond = threading.Condition()
+
+    def submit(self, job: DownloadJob) -> DownloadJob:
+        with self._cond:
+            old = self.jobs.get(job.job_id)
+            if old and old.state in ("queued", "paused", "waiting", "running"):
+                return old  # already scheduled
+            self.jobs[job.job_id] = job
+            self._push(job)
+            self._spawn_workers()
+            self._cond.notify()
+        self._changed()
+        return job
+
+    def pause(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.state not in ("queued", "running"):
+                return False
+            job._resume.clear()
+            if job.state == "queued":
+                job.state = "paused"
+        self._changed()
+        return True
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.cancelled:
+                return False
+            job._resume.set()
+            if job.state == "paused":
+                job.state = "queued"
+                item = self._parked.pop(job, None)
+                if item is not None:
+                    heapq.heappush(self._queues.setdefault(job.host, []), item)  # keeps its place in line
+            self._cond.notify_all()
+        self._changed()
+        return True
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.state in ("done", "failed", "cancelled"):
+                return False
+            job.cancelled = True
+            job._resume.set()  # let a paused running job reach its checkpoint
+            never_ran = job.state in ("queued", "paused", "waiting")
+            if never_ran:
+                self._waiting.discard(job)
+                self._parked.pop(job, None)
+                job.state = "cancelled"
+                self._retire(job)
+            self._cond.notify_all()
+        self._changed()
+        if never_ran and job.on_cancel is not None:
+            job.on_cancel(job)
+        return True
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def set_max_workers(self, count: int):
+        with self._cond:
+            self.max_workers = max(1, count)
+            self._spawn_workers()
+            self._cond.notify_all()
+        self._changed()
+
+    def set_per_host_limit(self, count: int):
+        with self._cond:
+            self.per_host_limit = max(1, count)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'queued': sum(1 for heap in self._queues.values() for _, _, j in heap if j.state == "queued"),
+                'paused': len(self._parked) + sum(1 for heap in self._queues.values() for _, _, j in heap
+                                                  if j.state == "paused"),
+                'waiting': len(self._waiting),
+                'active': self._active,
+                'workers': self.max_workers,
+                'hosts': dict(self._host_active),
+            }
+
+    def _retire(self, job: DownloadJob):
+        # called with the lock held once a job reached a final state
+        self._finished.append(job)
+        while len(self._finished) > self.keep_finished:
+            old = self._finished.popleft()
+            if self.jobs.get(old.job_id) is old:  # not resubmitted under the same id since
+                del self.jobs[old.job_id]
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self.stats())
+
+    def _spawn_workers(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _push(self, job: DownloadJob):
+        heapq.heappush(self._queues.setdefault(job.host, []), (job.priority, next(self._seq), job))
+
+    def _take_job(self):
+        # pop the best head among the hosts below their cap; busy hosts' heaps are not touched
+        best = None
+        for host, heap in list(self._queues.items()):
+            if self._host_active.get(host, 0) >= self.per_host_limit:
+                continue
+            while heap and heap[0][2].state != "queued":
+                item = heapq.heappop(heap)
+                if item[2].state == "paused":
+                    self._parked[item[2]] = item
+            if not heap:
+                del self._queues[host]
+            elif best is None or heap[0] < best[0]:
+                best = heap[0], host
+        if best is None:
+            return None
+        heap = self._queues[best[1]]
+        heapq.heappop(heap)
+        if not heap:
+            del self._queues[best[1]]
+        return best[0][2]
+
+    def _worker_loop(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if len(self._workers) > self.max_workers:
+                        self._workers.remove(me)  # pool was shrunk
+                        return
+                    job = self._take_job()
+                    if job is None:
+                        self._cond.wait()
+                job.state = "running"
+                self._active += 1
+                self._host_active[job.host] = self._host_active.get(job.host, 0) + 1
+            self._changed()
+            try:
+                job.result = job.target(*job.args, job=job)
+                failed = isinstance(job.result, dict) and not job.result.get('success', True)
+                state = "waiting" if isinstance(job.result, Deferred) else "failed" if failed else "done"
+            except Exception as e:
+                job.result = {'url': job.url, 'success': False, 'message': str(e)}
+                state = "failed"
+            with self._cond:
+                job.state = "cancelled" if job.cancelled else state
+                deferred = job.state == "waiting"
+                if deferred:
+                    self._waiting.add(job)
+                else:
+                    self._retire(job)
+                self._active -= 1
+                self._host_active[job.host] -= 1
+                if not self._host_active[job.host]:
+                    del self._host_active[job.host]
+                self._cond.notify_all()
+            self._changed()
+            if deferred:
+                job.result.register(lambda job=job: self._requeue(job))
+
+    def _requeue(self, job: DownloadJob):
+        # a waiting job's Deferred fired: back into the queue at its priority
+        with self._cond:
+            if job not in self._waiting:
+                return  # cancelled meanwhile
+            self._waiting.discard(job)
+            job.state = "queued"
+            self._push(job)
+            self._spawn_workers()
+            self._cond.notify()
+        self._changed()
+
+
+class SessionPool:
+    """
+    Long-lived yt_dlp.YoutubeDL sessions shared by jobs with the same options.
+    Reusing a session keeps its initialized extractors, cookies and keep-alive
+    HTTP connections; per-job settings (output template, progress hook) are
+    swapped in on checkout. A session that raised is closed instead of reused.
+    """
+    def __init__(self, params: dict, max_idle: int = 8):
+        self.params = params
+        self.max_idle = max_idle
+        self._idle = []
+        self._hooks = {}  # id(session) -> progress hook of the job using it
+        self._loggers = {}  # id(session) -> logger of the job using it
+        self._lock = threading.Lock()
+
+    class _Logger:
+        # yt-dlp logger that forwards to the logger of the job holding the session
+        def __init__(self, pool):
+            self.pool, self.key = pool, None
+
+        def _forward(self, level, msg):
+            logger = self.pool._loggers.get(self.key)
+            if logger is not None:
+                getattr(logger, level)(msg)
+
+        def debug(self, msg):
+            self._forward('debug', msg)
+
+        def info(self, msg):
+            self._forward('info', msg)
+
+        def warning(self, msg):
+            self._forward('warning', msg)
+
+        def error(self, msg):
+            self._forward('error', msg)
+
+    def _create(self):
+        logger = self._Logger(self)
+        ydl = yt_dlp.YoutubeDL(dict(self.params, logger=logger))
+        key = logger.key = id(ydl)
+        # one permanent hook that forwards to whichever job holds the session
+        ydl.add_progress_hook(lambda d: self._hooks.get(key) and self._hooks[key](d))
+        return ydl
+
+    @staticmethod
+    def _set_outtmpl(ydl, outtmpl: str):
+        current = ydl.params.get('outtmpl')
+        ydl.params['outtmpl'] = {**current, 'default': outtmpl} if isinstance(current, dict) else {'default': outtmpl}
+        if hasattr(ydl, 'outtmpl_dict'):  # older yt-dlp keeps a parsed copy
+            ydl.outtmpl_dict = ydl.parse_outtmpl()
+
+    @contextlib.contextmanager
+    def session(self, outtmpl: str = None, progress_hook=None, logger=None, params: dict = None):
+        with self._lock:
+            ydl = self._idle.pop() if self._idle else None
+        if ydl is None:
+            ydl = self._create()
+        ydl._download_retcode = 0  # download() returns the accumulated code
+        if outtmpl is not None:
+            self._set_outtmpl(ydl, outtmpl)
+        # per-job options; yt-dlp's downloaders read ydl.params when each download starts
+        for key, value in (params or {}).items():
+            ydl.params[key] = value
+        self._hooks[id(ydl)] = progress_hook
+        self._loggers[id(ydl)] = logger
+        try:
+            yield ydl
+        except BaseException:
+            self._hooks.pop(id(ydl), None)
+            self._loggers.pop(id(ydl), None)
+            self._close(ydl)
+            raise
+        self._hooks.pop(id(ydl), None)
+        self._loggers.pop(id(ydl), None)
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(ydl)
+                return
+        self._close(ydl)
+
+    @staticmethod
+    def _close(ydl):
+        try:
+            ydl.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for ydl in idle:
+            self._close(ydl)
+
+
+class InfoResolver:
+    """
+    Full extractions (format lists included) resolved ahead of the downloads
+    that need them, so a download worker hands the info dict straight to
+    process_ie_result instead of extracting the video a second time. At most
+    max_ready resolved or resolving infos wait to be claimed, and since the
+    stream URLs in them expire, unclaimed ones are dropped after ttl seconds.
+    A download waits at most wait_timeout seconds for a resolve in progress
+    before it extracts by itself.
+    """
+    def __init__(self, sessions: SessionPool, max_ready: int = 16, ttl: float = 1800, wait_timeout: float = 30):
+        self.sessions = sessions
+        self.max_ready = max_ready
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._ready = {}  # key -> (info, resolved_at)
+        self._flights = {}  # key -> Event set when its extraction is over
+        self._claimed = {}  # key -> time a download gave up waiting, its resolve is no longer wanted
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return video_id_of(url) or normalize_url(url)
+
+    def resolve(self, url: str, job=None):
+        """Extract url without processing it and keep the result for take(); runs on a worker."""
+        key = self.key(url)
+        with self._cond:
+            while True:
+                if key in self._ready or key in self._flights or (job is not None and job.cancelled):
+                    return
+                if self._claimed.pop(key, None) is not None:
+                    return  # the download started first and extracted by itself
+                self._expire()
+                if len(self._ready) + len(self._flights) < self.max_ready:
+                    break
+                self._cond.wait(1.0)  # wait for the downloads to claim what is ready
+            flight = self._flights[key] = threading.Event()
+        info = None
+        try:
+            with self.sessions.session() as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+            if info is None or info.get('_type') in ('url', 'url_transparent', 'playlist'):
+                info = None  # redirects and playlists go the normal way
+        except Exception:
+            info = None  # the download extracts again and reports the error itself
+        with self._cond:
+            del self._flights[key]
+            # discarded while extracting: nobody will take it
+            if info is not None and self._claimed.pop(key, None) is None:
+                self._ready[key] = (info, time.monotonic())
+            self._cond.notify_all()
+        flight.set()
+
+    def take(self, url: str):
+        """The resolved info for url (waiting up to wait_timeout for one in progress), or None if there is none."""
+        key = self.key(url)
+        with self._cond:
+            flight = self._flights.get(key)
+        if flight is not None:
+            flight.wait(self.wait_timeout)  # a hung extraction must not pin the download slot and session
+        with self._cond:
+            self._expire()
+            item = self._ready.pop(key, None)
+            if item is None:
+                self._claimed[key] = time.monotonic()
+            self._cond.notify_all()
+        return item[0] if item and time.monotonic() - item[1] < self.ttl else None
+
+    def discard(self, url: str):
+        with self._cond:
+            if self._ready.pop(self.key(url), None) is None:
+                self._claimed[self.key(url)] = time.monotonic()
+            self._cond.notify_all()
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [k for k, (_, at) in self._ready.items() if now - at >= self.ttl]:
+            del self._ready[key]
+        for key in [k for k, at in self._claimed.items() if now - at >= self.ttl]:
+            del self._claimed[key]
+
+
+# codecs that can go into an .mp4 container as they are
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3', 'opus', 'flac'}
+
+
+def probe_codecs(path: str):
+    """(video codec, audio codec) of a media file, None for a missing stream."""
+    out = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name',
+                          '-of', 'json', path], capture_output=True, text=True, check=True).stdout
+    codecs = {}
+    for stream in json.loads(out).get('streams', []):
+        codecs.setdefault(stream.get('codec_type'), stream.get('codec_name'))
+    return codecs.get('video'), codecs.get('audio')
+
+
+def ffmpeg_to_mp4(inputs: list, output_file: str, copy_video: bool = True, copy_audio: bool = False):
+    command = ['ffmpeg']
+    for name in inputs:
+        command += ['-i', name]
+    command += [
+        '-c:v', 'copy' if copy_video else 'libx264',
+        '-c:a', 'copy' if copy_audio else 'aac',
+        '-strict', 'experimental',
+        '-movflags', '+faststart',
+        '-y',  # overwrite output
+        output_file
+    ]
+    subprocess.run(command, capture_output=True, check=True)
+
+
+def convert_to_mp4(path: str) -> dict:
+    """
+    Post-process one download into an .mp4, run in a PostProcessPool worker.
+    Streams whose codec mp4 can hold are copied, so a container change is a
+    remux; only incompatible streams are re-encoded.
+    Returns:
+        dict: path of the result, action (none, remux, audio, transcode) and seconds taken
+    """
+    start = time.perf_counter()
+    base, ext = os.path.splitext(path)
+    if ext.lower() == '.mp4':
+        return {'path': path, 'action': 'none', 'seconds': time.perf_counter() - start}
+    video, audio = probe_codecs(path)
+    copy_video = video is None or video in MP4_VIDEO_CODECS
+    copy_audio = audio is None or audio in MP4_AUDIO_CODECS
+    output = base + '.mp4'
+    tmp = base + '.pp.mp4'
+    ffmpeg_to_mp4([path], tmp, copy_video=copy_video, copy_audio=copy_audio)
+    os.replace(tmp, output)
+    os.remove(path)
+    if copy_video and copy_audio:
+        action = 'remux'
+    elif copy_video:
+        action = 'audio'
+    else:
+        action = 'transcode'
+    return {'path': output, 'action': action, 'seconds': time.perf_counter() - start}
+
+
+class PostProcessPool:
+    """
+    Process pool (one worker per CPU core) that converts finished downloads,
+    so ffmpeg runs neither hold a download slot nor oversubscribe the CPU.
+    """
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.available = shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+    def submit(self, path: str, callback):
+        """Run convert_to_mp4(path) and call callback(result, error) from a pool thread."""
+        with self._lock:
+            if self._executor is None:
+                # forking a process full of threads is not safe
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            self._pending += 1
+            future = self._executor.submit(convert_to_mp4, path)
+
+        def done(f):
+            try:
+                result, error = f.result(), None
+            except BaseException as e:  # including CancelledError after shutdown(), the job must still finish
+                result, error = None, e
+            try:
+                callback(result, error)
+            finally:
+                # only now, so wait() doesn't return while the callback still records the job
+                with self._lock:
+                    self._pending -= 1
+        future.add_done_callback(done)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class _WorkerChannel:
+    """
+    Child side of a ProcessWorkerPool pipe: yt-dlp progress hook and logger.
+    Progress is sent as small tuples at most every interval seconds and each
+    one waits for the parent's ack, so pausing or rate limiting the job in the
+    parent holds the download in the child too. A thread sends a heartbeat
+    every heartbeat seconds, also while yt-dlp or ffmpeg say nothing.
+    """
+    def __init__(self, conn, interval: float, heartbeat: float):
+        self.conn = conn
+        self.interval = interval
+        self._send_lock = threading.Lock()  # the heartbeat thread sends on the same pipe
+        self.reset()
+        threading.Thread(target=self._heartbeat_loop, args=(heartbeat,), daemon=True).start()
+
+    def reset(self):
+        self.sent = 0.0
+        self.skipped = None  # last throttled 'downloading' dict
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _heartbeat_loop(self, heartbeat):
+        while True:
+            time.sleep(heartbeat)
+            try:
+                self.send(('alive',))
+            except (OSError, ValueError):
+                return  # pipe closed, the process is exiting
+
+    def _send(self, d: dict):
+        self.send(('p', d['status'], d.get('downloaded_bytes'), d.get('total_bytes') or d.get('total_bytes_estimate'),
+                   d.get('speed'), d.get('eta'), d.get('filename'), d.get('fragment_count')))
+        self.sent = time.monotonic()
+        self.conn.recv()
+
+    def progress(self, d: dict):
+        if d['status'] == 'downloading':
+            if time.monotonic() - self.sent < self.interval:
+                self.skipped = d
+                return
+            self.skipped = None
+        elif self.skipped is not None:
+            self._send(self.skipped)  # the parent should see the final byte count
+            self.skipped = None
+        self._send(d)
+
+    def _log(self, level, msg):
+        # only retries (counted in the job metrics), warnings and errors cross the pipe
+        if level != 'debug' or "Retrying" in msg:
+            self.send(('log', level, msg))
+
+    def debug(self, msg):
+        self._log('debug', msg)
+
+    info = debug
+
+    def warning(self, msg):
+        self._log('warning', msg)
+
+    def error(self, msg):
+        self._log('error', msg)
+
+
+def _process_worker(conn, params: dict, interval: float, heartbeat: float):
+    # runs in the worker process: one download at a time, on a session kept for the next one
+    sessions = SessionPool(params, max_idle=1)
+    channel = _WorkerChannel(conn, interval, heartbeat)
+    try:
+        channel.send(('ready',))  # imports are done, the timeouts apply from here on
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            url, outtmpl, job_params = task
+            channel.reset()
+            try:
+                with sessions.session(outtmpl, channel.progress, logger=channel, params=job_params) as ydl:
+                    info = ydl.extract_info(url, download=True)
+                    failed = info is None or bool(ydl._download_retcode)
+                    outcome = {'failed': failed, 'filepath': None, 'video_id': None, 'title': None}
+                    if not failed:
+                        downloads = info.get('requested_downloads') or [info]
+                        outcome.update(filepath=downloads[-1].get('filepath') or ydl.prepare_filename(info),
+                                       video_id=info.get('id'), title=info.get('title'))
+            except Exception as e:
+                outcome = {'error': str(e)}
+            channel.send(('done', outcome))
+    except (EOFError, KeyboardInterrupt):
+        pass  # parent went away
+    finally:
+        sessions.close()
+
+
+class ProcessWorkerPool:
+    """
+    Download worker processes, so yt-dlp's extractors and downloaders neither
+    hold the GUI's GIL nor take the app down when they hang or crash. Each
+    worker talks to the scheduler thread that checked it out over a Pipe. A
+    worker that dies, misses its heartbeats (sent every heartbeat seconds) or
+    makes no transfer progress for stall_timeout seconds while downloading is
+    killed and a fresh one is started for the next job; extraction and
+    post-processing (a long ffmpeg merge) only need the heartbeat.
+    """
+    def __init__(self, params: dict, stall_timeout: float = 120, interval: float = 0.1, max_idle: int = 32,
+                 start_timeout: float = 60, heartbeat: float = 5):
+        self.params = params
+        self.stall_timeout = stall_timeout
+        self.heartbeat = heartbeat
+        self.start_timeout = start_timeout
+        self.interval = interval
+        self.max_idle = max_idle
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')  # forking a process full of threads is not safe
+        self._idle = []
+        self._busy = set()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _start(self):
+        conn, child = self._context.Pipe()
+        process = self._context.Process(target=_process_worker, args=(child, self.params, self.interval, self.heartbeat),
+                                        daemon=True,
+                                        name="download-worker")
+        process.start()
+        child.close()
+        try:
+            if conn.poll(self.start_timeout) and conn.recv() == ('ready',):
+                return process, conn
+        except (EOFError, ConnectionError):
+            pass
+        self._kill((process, conn))
+        raise RuntimeError(f"worker process {process.pid} did not start (exit code {process.exitcode})")
+
+    def _checkout(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("worker pool is closed")
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker[0].is_alive():
+            if worker is not None:
+                self._kill(worker)
+            worker = self._start()
+        with self._lock:
+            self._busy.add(worker)
+        return worker
+
+    def _checkin(self, worker):
+        with self._lock:
+            self._busy.discard(worker)
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(worker)
+                return
+        self._stop(worker)
+
+    def _kill(self, worker):
+        process, conn = worker
+        with self._lock:
+            self._busy.discard(worker)
+        process.kill()
+        process.join(5)
+        conn.close()
+
+    @staticmethod
+    def _stop(worker):
+        process, conn = worker
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+        conn.close()
+
+    def run(self, url: str, outtmpl: str, params: dict = None, progress_hook=None, logger=None) -> dict:
+        """
+        Download url in a worker process; returns failed, filepath, video_id and title.
+        progress_hook and logger are called on this thread; whatever they raise
+        (a cancelled job) kills the worker and is raised here.
+        """
+        worker = self._checkout()
+        process, conn = worker
+        try:
+            conn.send((url, outtmpl, params or {}))
+            heard = progressed = time.monotonic()
+            transferring = False  # between a 'downloading' and the 'finished' of a file
+            while True:
+                if conn.poll(min(1.0, self.heartbeat)):
+                    message = conn.recv()
+                    heard = time.monotonic()
+                else:
+                    message = ('alive',)
+                    if time.monotonic() - heard > 6 * self.heartbeat:
+                        raise TimeoutError(f"worker process {process.pid} stopped responding, restarting it")
+                if transferring and time.monotonic() - progressed > self.stall_timeout:
+                    raise TimeoutError(f"worker process {process.pid} stalled for {self.stall_timeout:g}s, restarting it")
+                if message[0] == 'p':
+                    status, done, total, speed, eta, filename, fragments = message[1:]
+                    transferring = status == 'downloading'
+                    if progress_hook is not None:
+                        progress_hook({'status': status, 'downloaded_bytes': done, 'total_bytes': total, 'speed': speed,
+                                       'eta': eta, 'filename': filename, 'fragment_count': fragments})
+                    conn.send(True)
+                    heard = progressed = time.monotonic()  # a paused or rate limited hook is not a stall
+                elif message[0] == 'log':
+                    if logger is not None:
+                        getattr(logger, message[1])(message[2])
+                elif message[0] == 'done':
+                    outcome = message[1]
+                    break
+        except (EOFError, ConnectionError):
+            self._kill(worker)
+            self.restarts += 1
+            raise RuntimeError(f"worker process {process.pid} crashed (exit code {process.exitcode}), restarting it")
+        except BaseException:
+            self._kill(worker)
+            self.restarts += 1
+            raise
+        self._checkin(worker)
+        if 'error' in outcome:
+            raise RuntimeError(outcome['error'])
+        return outcome
+
+    def close(self, kill_busy: bool = False):
+        """Stop the idle workers; busy ones stop when their job ends, or right away with kill_busy."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            busy = list(self._busy) if kill_busy else []
+        for worker in idle:
+            self._stop(worker)
+        for worker in busy:
+            worker[0].kill()  # the job's thread sees the pipe close and cleans up
+
+
+def iter_entries(entries, page_size: int = 100):
+    """Iterate playlist entries from yt-dlp without materialising them: generators and LazyLists as is, PagedLists a page at a time."""
+    if hasattr(entries, 'getslice'):
+        start = 0
+        while True:
+            page = entries.getslice(start, start + page_size)
+            if not page:
+                return
+            yield from page
+            start += len(page)
+    else:
+        yield from entries
+
+
+def seconds_to_time(seconds):
+    if seconds is None:
+        return "00:00:00"
+    seconds = int(seconds)
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    return f"{hours:02}:{minutes:02}:{secs:02}"
+
+
+def format_bytes(count) -> str:
+    if count is None:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1024
+
+
+def format_percent(done, total) -> str:
+    return f"{100 * done / total:.1f}%" if done is not None and total else ""
+
+
+def format_speed(speed) -> str:
+    return format_bytes(speed) + "/s" if speed is not None else ""
+
+
+class ProgressTable:
+    """
+    Latest progress snapshot per grid row. Download threads write into it at
+    whatever rate yt-dlp calls the hook; the UI drains only the rows that
+    changed since the last drain, so repaint cost is bounded by the frame rate.
+    """
+    def __init__(self):
+        self._rows = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def update(self, row: int, percent: str = None, speed: str = None, eta: str = None, finished: bool = False):
+        with self._lock:
+            snap = self._rows.setdefault(row, {'percent': "", 'speed': "", 'eta': "", 'finished': False})
+            if percent is not None:
+                snap['percent'] = percent
+            if speed is not None:
+                snap['speed'] = speed
+            if eta is not None:
+                snap['eta'] = eta
+            snap['finished'] = snap['finished'] or finished
+            self._dirty.add(row)
+
+    def get(self, row: int):
+        with self._lock:
+            snap = self._rows.get(row)
+            return dict(snap) if snap else None
+
+    def drain(self) -> dict:
+        """Return {row: snapshot} for rows changed since the last call."""
+        with self._lock:
+            changed = {row: dict(self._rows[row]) for row in self._dirty}
+            self._dirty.clear()
+        return changed
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._dirty.clear()
+
+
+class JobMetrics:
+    """
+    Timings and counters of one download job, fed from the numeric fields of
+    yt-dlp's progress dicts and the retry and error messages of its logger.
+    """
+    def __init__(self, job_id, url: str):
+        self.job_id = job_id
+        self.url = url
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.end = None
+        self.files = {}  # filename -> bytes downloaded
+        self.peak_speed = 0.0
+        self.retries = 0
+        self.error_message = None  # yt-dlp's last error line, reported when the download fails
+        self.fragments = 0
+        self.download_time = 0.0
+        self.postprocess_time = 0.0
+        self.status = None
+
+    def on_progress(self, d: dict):
+        done = d.get('downloaded_bytes') or 0
+        if self.first_byte is None and done:
+            self.first_byte = time.perf_counter()
+        self.files[d.get('filename')] = done
+        if d.get('speed'):
+            self.peak_speed = max(self.peak_speed, d['speed'])
+        if d.get('fragment_count'):
+            self.fragments = max(self.fragments, d['fragment_count'])
+
+    # yt-dlp logger interface, retries are counted and the last error kept
+    def debug(self, msg):
+        if "Retrying" in msg:
+            self.retries += 1
+
+    info = debug
+
+    def warning(self, msg):
+        self.debug(msg)
+
+    def error(self, msg):
+        self.debug(msg)
+        self.error_message = msg
+
+    def downloaded(self):
+        self.end = time.perf_counter()
+        self.download_time = self.end - self.start
+
+    @property
+    def bytes(self) -> int:
+        return sum(self.files.values())
+
+    @property
+    def ttfb(self):
+        return self.first_byte - self.start if self.first_byte is not None else None
+
+    @property
+    def mean_speed(self) -> float:
+        if self.first_byte is None or self.end is None or self.end <= self.first_byte:
+            return 0.0
+        return self.bytes / (self.end - self.first_byte)
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id, 'url': self.url, 'status': self.status, 'bytes': self.bytes,
+            'ttfb': round(self.ttfb, 3) if self.ttfb is not None else None,
+            'download_time': round(self.download_time, 3), 'postprocess_time': round(self.postprocess_time, 3),
+            'mean_speed': round(self.mean_speed), 'peak_speed': round(self.peak_speed),
+            'retries': self.retries, 'fragments': self.fragments,
+        }
+
+
+class MetricsRegistry:
+    """
+    Aggregates of finished jobs, dumped as JSON or Prometheus text format.
+    The most recent jobs are kept individually for the JSON dump.
+    """
+    def __init__(self, keep_jobs: int = 1000):
+        self.jobs = deque(maxlen=keep_jobs)
+        self.status = {}
+        self.totals = {'bytes': 0, 'retries': 0, 'fragments': 0, 'download_time': 0.0,
+                       'postprocess_time': 0.0, 'ttfb': 0.0, 'ttfb_count': 0}
+        self.peak_speed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, metrics: JobMetrics):
+        with self._lock:
+            self.jobs.append(metrics.to_dict())
+            self.status[metrics.status] = self.status.get(metrics.status, 0) + 1
+            self.totals['bytes'] += metrics.bytes
+            self.totals['retries'] += metrics.retries
+            self.totals['fragments'] += metrics.fragments
+            self.totals['download_time'] += metrics.download_time
+            self.totals['postprocess_time'] += metrics.postprocess_time
+            if metrics.ttfb is not None:
+                self.totals['ttfb'] += metrics.ttfb
+                self.totals['ttfb_count'] += 1
+            self.peak_speed = max(self.peak_speed, metrics.peak_speed)
+
+    def summary(self) -> dict:
+        with self._lock:
+            count = sum(self.status.values())
+            totals = dict(self.totals)
+            return {
+                'jobs': dict(self.status),
+                'bytes': totals['bytes'],
+                'retries': totals['retries'],
+                'fragments': totals['fragments'],
+                'download_time': round(totals['download_time'], 3),
+                'postprocess_time': round(totals['postprocess_time'], 3),
+                'mean_ttfb': round(totals['ttfb'] / totals['ttfb_count'], 3) if totals['ttfb_count'] else None,
+                'mean_download_time': round(totals['download_time'] / count, 3) if count else None,
+                'mean_speed': round(totals['bytes'] / totals['download_time']) if totals['download_time'] else 0,
+                'peak_speed': round(self.peak_speed),
+            }
+
+    def to_json(self) -> str:
+        with self._lock:
+            jobs = list(self.jobs)
+        return json.dumps({'summary': self.summary(), 'jobs': jobs}, indent=2)
+
+    def to_prometheus(self, scheduler_stats: dict = None) -> str:
+        summary = self.summary()
+        with self._lock:
+            totals = dict(self.totals)
+        lines = ["# TYPE ytd_jobs_total counter"]
+        lines += [f'ytd_jobs_total{{status="{status}"}} {count}' for status, count in summary['jobs'].items()]
+        for name, value, kind in (
+                ("ytd_downloaded_bytes_total", totals['bytes'], "counter"),
+                ("ytd_retries_total", totals['retries'], "counter"),
+                ("ytd_fragments_total", totals['fragments'], "counter"),
+                ("ytd_peak_speed_bytes_per_second", summary['peak_speed'], "gauge"),
+                ("ytd_mean_speed_bytes_per_second", summary['mean_speed'], "gauge")):
+            lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+        count = sum(summary['jobs'].values())
+        for name, total, n in (
+                ("ytd_download_seconds", totals['download_time'], count),
+                ("ytd_postprocess_seconds", totals['postprocess_time'], count),
+                ("ytd_ttfb_seconds", totals['ttfb'], totals['ttfb_count'])):
+            lines += [f"# TYPE {name} summary", f"{name}_sum {total:.3f}", f"{name}_count {n}"]
+        if scheduler_stats:
+            for key, name in (("queued", "ytd_queued_jobs"), ("paused", "ytd_paused_jobs"),
+                              ("waiting", "ytd_waiting_jobs"), ("active", "ytd_active_jobs"),
+                              ("workers", "ytd_max_workers")):
+                lines += [f"# TYPE {name} gauge", f"{name} {scheduler_stats[key]}"]
+        return "\n".join(lines) + "\n"
+
+
+def watch_url(video: dict) -> str:
+    return f"https://www.youtube.com/watch?v={video['id']}"
+
+
+def video_id_of(url: str):
+    """YouTube video id of a watch/youtu.be/shorts URL, None for anything else."""
+    parsed = urlparse("https://" + normalize_url(url))
+    if parsed.path == "/watch":
+        return parse_qs(parsed.query).get("v", [None])[0]
+    if parsed.path.startswith("/shorts/"):
+        return parsed.path.split("/")[2] or None
+    return None
+
+
+class DownloadEngine:
+    """
+    Fetches flat metadata and runs downloads on a DownloadScheduler, reporting
+    everything through subscriber callbacks called as callback(event, data):
+
+        queue     scheduler stats (queued, paused, active, workers, hosts)
+        fetched   url, title, count, cached
+        progress  job_id, url, downloaded_bytes, total_bytes, speed (bytes/s), eta (s)
+        finished  job_id, url              (file downloaded, post-processing next)
+        downloaded job_id, url, success, download_time
+        done      job_id, url, success, message, download_time, postprocess_time, action
+        skipped   job_id, url              (already done according to the job journal)
+        refreshed url, title, count, new, not_downloaded, seconds, success, message
+        refresh_done results               (all refreshed results of one refresh_all call)
+        log       message
+
+    Callbacks run on engine threads; GUI subscribers must marshal to their own thread.
+    """
+    FULL_INFO_CACHE = 32  # complete info dicts kept by full_info()
+
+    def __init__(self, max_workers: int = 4, per_host_limit: int = 3, cache_dir: str = None, journal_path: str = None,
+                 rate_limit: float = 0, archive_path: str = None, fragment_cap: int = 16, isolate: bool = False):
+        app_dir = os.path.join(os.path.expanduser("~"), ".youtube_downloader")
+        self.metadata_cache = MetadataCache(cache_dir or os.path.join(app_dir, "metadata"))
+        self.thumbnails = ThumbnailCache(os.path.join(cache_dir, "thumbnails") if cache_dir
+                                         else os.path.join(app_dir, "thumbnails"))
+        self.journal = JobJournal(journal_path or os.path.join(app_dir, "jobs.db"))
+        # next to the journal by default, so tests with a private journal get a private archive too
+        self.archive = DownloadArchive(archive_path or os.path.join(os.path.dirname(os.path.abspath(self.journal.path)), "archive.db"))
+        self.store = ContentStore(self.archive.path)
+        self.scheduler = DownloadScheduler(max_workers=max_workers, per_host_limit=per_host_limit,
+                                           on_change=lambda stats: self.emit('queue', **stats))
+        self._subscribers = []
+        self._shutting_down = False
+        self.extract_sessions = SessionPool({'quiet': True, 'extract_flat': 'in_playlist'}, max_idle=4)
+        self.download_sessions = SessionPool(self.download_options(), max_idle=32)
+        self.resolver = InfoResolver(self.download_sessions)
+        # resolves the formats of queued videos ahead of the download workers
+        self.resolve_scheduler = DownloadScheduler(max_workers=4, per_host_limit=4)
+        self.process_pool = None  # ProcessWorkerPool while downloads run isolated, see set_isolated()
+        self.set_isolated(isolate)
+        self.postprocess = PostProcessPool()
+        self.limiter = BandwidthLimiter(rate_limit)
+        self.fragments = FragmentTuner(global_cap=fragment_cap)
+        # metadata refreshes get their own pool so they never wait behind downloads
+        self.refresh_scheduler = DownloadScheduler(max_workers=8, per_host_limit=6)
+        self._full_info = OrderedDict()  # video id -> full info dict, see full_info()
+        self._full_info_lock = threading.Lock()
+        self._refresh_round = itertools.count()
+        self.metrics = MetricsRegistry()
+
+    def set_isolated(self, enabled: bool):
+        """Run new downloads in worker processes (True) or on the scheduler threads (False)."""
+        if enabled and self.process_pool is None:
+            self.process_pool = ProcessWorkerPool(self.download_options())
+        elif not enabled and self.process_pool is not None:
+            pool, self.process_pool = self.process_pool, None
+            pool.close()  # running downloads finish in their process
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def emit(self, event: str, **data):
+        for callback in list(self._subscribers):
+            try:
+                callback(event, data)
+            except Exception:
+                pass  # a broken subscriber must not kill a download thread
+
+    def extract_flat(self, url: str, on_page=None, page_size: int = 100, cancelled=None) -> dict:
+        """
+        Flat metadata for url. With on_page, playlist entries are enumerated
+        lazily and on_page(info, start, done) gets each page of page_size
+        entries as soon as yt-dlp has them (info['entries'] is just that page,
+        start its offset in the playlist). Returns None if cancelled() turned
+        true during enumeration.
+        """
+        if on_page is None:
+            # 'in_playlist' resolves a watch?v=..&list=.. link to its playlist in the
+            # same pass while keeping the playlist entries flat
+            with self.extract_sessions.session() as ydl:
+                info = ydl.extract_info(url, download=False)
+                info = ydl.sanitize_info(info)
+            if info.get('entries') is not None:
+                info['entries'] = list(info['entries'])
+            return info
+        with self.extract_sessions.session() as ydl:
+            # process=False hands back the extractor's result with entries still a generator
+            info = ydl.extract_info(url, download=False, process=False)
+            for _ in range(5):  # watch?v=..&list=.. first redirects to the playlist
+                if info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+            if info.get('_type') != 'playlist':
+                info = ydl.sanitize_info(ydl.process_ie_result(info, download=False))
+                info.pop('entries', None)
+                on_page(info, 0, True)
+                return info
+            head = ydl.sanitize_info({k: v for k, v in info.items() if k != 'entries'})
+            entries, page = [], []
+            for entry in iter_entries(info.get('entries') or [], page_size):
+                if cancelled and cancelled():
+                    return None
+                page.append(ydl.sanitize_info(entry) if entry else entry)
+                if len(page) >= page_size:
+                    on_page(dict(head, entries=page), len(entries), False)
+                    entries += page
+                    page = []
+            on_page(dict(head, entries=page), len(entries), True)
+        return dict(head, entries=entries + page)
+
+    def fetch(self, url: str, on_info=None, cancelled=None, on_page=None, page_size: int = 100) -> dict:
+        """
+        Flat metadata for url, served from the metadata cache when possible.
+        on_info(info) is called with the cached copy first (if any) and again
+        only if revalidation found a different list. cancelled() is checked
+        before going to the network. When nothing is cached and on_page is
+        given, the list is streamed to on_page page by page instead (see
+        extract_flat) and on_info is not called.
+        Returns:
+            dict: the most recent info, or None if cancelled before fetching
+        """
+        info, fresh = self.metadata_cache.get(url)
+        if info is not None:
+            if on_info:
+                on_info(info)
+            if fresh:
+                self.emit('fetched', url=url, title=info.get('title'), count=len(info.get('entries') or [info]), cached=True)
+                return info  # no network while the cached copy is within its TTL
+        if cancelled and cancelled():
+            return info
+        if info is None and on_page is not None:
+            new_info = self.extract_flat(url, on_page=on_page, page_size=page_size, cancelled=cancelled)
+            if new_info is None:
+                return None  # cancelled half way, don't cache a partial list
+            self.metadata_cache.put(url, new_info)
+            new_info = self.metadata_cache.slim(new_info)
+            self.emit('fetched', url=url, title=new_info.get('title'), count=len(new_info.get('entries') or [new_info]), cached=False)
+            return new_info
+        new_info = self.extract_flat(url)
+        changed = self.metadata_cache.put(url, new_info)
+        new_info = self.metadata_cache.slim(new_info)
+        if on_info and (info is None or changed):
+            on_info(new_info)
+        elif not changed:
+            self.emit('log', message="Cached list is up to date: " + url)
+        self.emit('fetched', url=url, title=new_info.get('title'), count=len(new_info.get('entries') or [new_info]), cached=False)
+        return new_info
+
+    def submit(self, job_id, url: str, output_path: str, playlist_index: int = None, priority: int = 0,
+               force: bool = False, weight: float = 1.0, entry_url: str = None) -> DownloadJob:
+        """
+        Queue a download; returns None if the journal already has it done (unless force).
+        entry_url is the library entry (playlist) the video is archived under.
+        """
+        if not force and self.journal.state(JobJournal.key(url, output_path)) == "done":
+            self.emit('skipped', job_id=job_id, url=url)
+            return None
+        active = self.scheduler.jobs.get(job_id)
+        if active is not None and active.state in ("queued", "paused", "waiting", "running"):
+            return active  # already scheduled: its journal row (state, progress) is left alone
+        # journaled before the scheduler gets the job, so the row exists when a worker picks it up
+        self.journal.queued(url, output_path, playlist_index, entry_url)
+        job = DownloadJob(job_id, url, self.download, args=(url, output_path, job_id, playlist_index, weight, entry_url),
+                          priority=priority)
+        scheduled = self.scheduler.submit(job)
+        if scheduled is job and video_id_of(url) and self.process_pool is None:
+            # only a newly queued download claims a resolved info (a resolve that comes after
+            # the download started is skipped); worker processes resolve for themselves
+            self.resolve_scheduler.submit(DownloadJob(f"resolve:{job_id}", url, self.resolver.resolve, args=(url,),
+                                                      priority=priority))
+        return scheduled
+
+    def cancel(self, job_id) -> bool:
+        """Cancel a job for good; it will not be resumed in a later session."""
+        job = self.scheduler.jobs.get(job_id)
+        if job is None or not self.scheduler.cancel(job_id):
+            return False
+        self.journal.set_state(JobJournal.key(job.args[0], job.args[1]), "cancelled")
+        self.resolve_scheduler.cancel(f"resolve:{job_id}")
+        self.resolver.discard(job.args[0])
+        return True
+
+    def shutdown(self):
+        """Stop all downloads but leave them unfinished in the journal so they resume next time."""
+        self._shutting_down = True
+        self.scheduler.cancel_all()
+        self.refresh_scheduler.cancel_all()
+        self.resolve_scheduler.cancel_all()
+        self.extract_sessions.close()
+        self.download_sessions.close()
+        if self.process_pool is not None:
+            self.process_pool.close(kill_busy=True)
+        self.postprocess.shutdown()
+
+    def resume_pending(self) -> list:
+        """
+        Queue again every job the journal shows as unfinished from an earlier session.
+        Job ids are the journal keys, so the GUI finds them again when it shows their playlist.
+        """
+        jobs = []
+        for n, record in enumerate(self.journal.pending()):
+            job = self.submit(JobJournal.key(record['url'], record['output_path']), record['url'], record['output_path'],
+                              playlist_index=record['playlist_index'], priority=n, entry_url=record['entry_url'])
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def finished_rows(self, videos: list, output_path: str, start: int = 0) -> set:
+        """Indexes (counted from start) of videos the journal has as done in output_path or the archive has at all."""
+        keys = {JobJournal.key(watch_url(v), output_path): i for i, v in enumerate(videos, start) if v and v.get('id')}
+        rows = {keys[k] for k in self.journal.done_keys(keys)}
+        ids = {v['id']: i for i, v in enumerate(videos, start) if v and v.get('id')}
+        return rows | {ids[v] for v in self.archive.lookup(ids)}
+
+    def refresh_all(self, urls, on_done=None) -> list:
+        """
+        Re-extract every url in parallel on refresh_scheduler (bounded pool,
+        per-host limit) and store the lists in the metadata cache. Each url
+        reports a 'refreshed' event; on_done(results) and 'refresh_done' follow
+        once the last one is finished, so the whole batch takes about as long
+        as its slowest extraction when the pool is wide enough.
+        """
+        urls = list(urls)
+        results, lock = [], threading.Lock()
+
+        def finished(result):
+            with lock:
+                results.append(result)
+                last = len(results) == len(urls)
+            if last:
+                self.emit('refresh_done', results=list(results))
+                if on_done:
+                    on_done(list(results))
+
+        def cancelled(job):
+            # cancelled while still queued, _refresh never runs for it
+            result = {'url': job.url, 'title': None, 'count': 0, 'new': 0, 'not_downloaded': 0, 'success': False,
+                      'message': "Cancelled", 'seconds': 0.0}
+            self.emit('refreshed', **result)
+            finished(result)
+
+        if not urls:
+            self.emit('refresh_done', results=[])
+            if on_done:
+                on_done([])
+        round_id = next(self._refresh_round)
+        return [self.refresh_scheduler.submit(DownloadJob(f"refresh:{round_id}:{i}", url, self._refresh,
+                                                          args=(url, finished), priority=i, on_cancel=cancelled))
+                for i, url in enumerate(urls)]
+
+    def _refresh(self, url: str, finished, job: DownloadJob = None) -> dict:
+        start = time.perf_counter()
+        old, _ = self.metadata_cache.get(url)
+        old_ids = {v.get('id') for v in (old.get('entries') or [old]) if v} if old else None
+        try:
+            if job is not None:
+                job.checkpoint()
+            info = self.metadata_cache.slim(self.extract_flat(url))
+            self.metadata_cache.put(url, info)
+            entries = info['entries'] if info.get('entries') is not None else [info]
+            ids = [v['id'] for v in entries if v and v.get('id')]
+            result = {'url': url, 'title': info.get('title'), 'count': len(ids), 'success': True, 'message': "",
+                      'new': len(ids) if old_ids is None else len(set(ids) - old_ids),
+                      'not_downloaded': len(self.archive.missing(ids, check_files=False))}
+        except Exception as e:
+            result = {'url': url, 'title': old.get('title') if old else None, 'count': 0, 'new': 0,
+                      'not_downloaded': 0, 'success': False, 'message': str(e)}
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        self.emit('refreshed', **result)
+        finished(result)
+        return result
+
+    def full_info(self, video) -> dict:
+        """
+        Complete metadata of one video (a VideoRecord or entry dict), extracted
+        on demand and kept in a small LRU; the grid only holds compact records.
+        """
+        with self._full_info_lock:
+            if video['id'] in self._full_info:
+                self._full_info.move_to_end(video['id'])
+                return self._full_info[video['id']]
+        with self.extract_sessions.session() as ydl:
+            info = ydl.sanitize_info(ydl.extract_info(watch_url(video), download=False))
+        with self._full_info_lock:
+            self._full_info[video['id']] = info
+            while len(self._full_info) > self.FULL_INFO_CACHE:
+                self._full_info.popitem(last=False)
+        return info
+
+    def plan_sync(self, url: str, check_files: bool = True):
+        """
+        Fresh flat extraction of url diffed against the download archive.
+        Videos already archived are linked to url as its members.
+        Returns:
+            tuple: (info, indexes of the entries that are new or whose file is missing)
+        """
+        info = self.extract_flat(url)
+        self.metadata_cache.put(url, info)
+        info = self.metadata_cache.slim(info)
+        entries = info['entries'] if info.get('entries') is not None else [info]
+        ids = [v['id'] for v in entries if v and v.get('id')]
+        missing = self.archive.missing(ids, check_files)
+        self.archive.link(url, (v for v in ids if v not in missing))
+        return info, [i for i, v in enumerate(entries) if v and v.get('id') in missing]
+
+    def sync(self, url: str, output_path: str, id_prefix: str = "", check_files: bool = True) -> list:
+        """Queue only the videos of url that are not in the archive (or no longer on disk)."""
+        info, rows = self.plan_sync(url, check_files)
+        entries = info.get('entries')
+        if entries is None:
+            targets = [(0, info, output_path, None)] if rows else []
+        else:
+            folder = os.path.join(output_path, info.get('title') or "")
+            targets = [(i, entries[i], folder, i + 1) for i in rows]
+        self.emit('log', message=f"Sync {url}: {len(targets)} new or missing of {len(entries or [info])}")
+        # force past the journal: a video it has as done may have been deleted since
+        jobs = [self.submit(f"{id_prefix}{i}", watch_url(video), folder, playlist_index=index, priority=i,
+                            force=True, entry_url=url)
+                for i, video, folder, index in targets]
+        return [job for job in jobs if job is not None]
+
+    def submit_info(self, info: dict, output_path: str, id_prefix: str = "", start: int = 0, entry_url: str = None) -> list:
+        """
+        Queue every video of a flat extraction; playlists go into a folder named
+        after them. start is the playlist offset of info['entries'] when it is one page.
+        """
+        entries = info.get('entries')
+        if entries is None:
+            return [self.submit(id_prefix + str(info.get('id')), info.get('webpage_url') or watch_url(info), output_path,
+                                entry_url=entry_url)]
+        folder = os.path.join(output_path, info.get('title') or "")
+        jobs = [self.submit(f"{id_prefix}{i}", watch_url(video), folder, playlist_index=i + 1, priority=i,
+                            entry_url=entry_url)
+                for i, video in enumerate(entries, start) if video and video.get('id')]
+        return [job for job in jobs if job is not None]
+
+    def wait(self, poll: float = 0.2):
+        """Block until no job is queued, downloading or post-processing."""
+        while True:
+            stats = self.scheduler.stats()
+            if not stats['queued'] and not stats['waiting'] and not stats['active'] and not self.postprocess.pending:
+                return
+            time.sleep(poll)
+
+    def export_metrics(self, path: str):
+        """Write job metrics to path: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.lower().endswith((".prom", ".txt")):
+            text = self.metrics.to_prometheus(self.scheduler.stats())
+        else:
+            text = self.metrics.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def download_options(self) -> dict:
+        # Configure yt-dlp options for MP4 only; outtmpl and the progress hook are set per job
+        return {
+            'merge_output_format': 'mp4',
+            'ignoreerrors': True,
+            'no_warnings': False,
+            'extract_flat': False,
+            # Disable all additional downloads for clean MP4-only output
+            'writesubtitles': False,
+            'writethumbnail': False,
+            'writeautomaticsub': False,
+            # conversion to mp4 runs in the PostProcessPool, not in the download thread
+            # Clean up options
+            'keepvideo': False,
+            'clean_infojson': True,
+            'retries': 3,
+            'fragment_retries': 3,
+            'continuedl': True,  # resume from .part files left by an interrupted session
+        }
+
+    def download(self, url: str, output_path: str, job_id=0, playlist_index: int = None, weight: float = 1.0,
+                 entry_url: str = None, job: DownloadJob = None) -> dict:
+        """
+        Download a single YouTube video.
+        Args:
+            url (str): YouTube URL to download
+            output_path (str): Directory to save the download
+            job_id: Identifier reported with every event of this download
+            playlist_index (int): 1-based position in its playlist, used as the file name prefix
+            weight (float): Share of the global bandwidth limit relative to other running jobs
+            entry_url (str): Library entry the video is archived under
+            job (DownloadJob): Scheduler job, checked for pause/cancel on every progress tick
+        Returns:
+            dict: Result status with success/failure info, or a Deferred while another job
+            downloads the same video
+        """
+        journal_key = JobJournal.key(url, output_path)
+        received = {}  # filename -> bytes already charged to the limiter
+        metrics = JobMetrics(job_id, url)
+
+        def hook(d):
+            if job is not None:
+                job.checkpoint()
+            if d['status'] == 'downloading':
+                done = d.get('downloaded_bytes') or 0
+                name = d.get('filename')
+                self.limiter.consume(job_id, max(0, done - received.get(name, 0)))
+                received[name] = done
+                metrics.on_progress(d)
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                self.journal.progress(journal_key, done, total)
+                self.emit('progress', job_id=job_id, url=url, downloaded_bytes=done, total_bytes=total,
+                          speed=d.get('speed'), eta=d.get('eta'))
+            elif d['status'] == 'finished':
+                self.journal.set_state(journal_key, "postprocessing")
+                self.emit('finished', job_id=job_id, url=url)
+
+        # Set different output templates for playlist items and single videos
+        prefix = f'{playlist_index}-' if playlist_index is not None else ''
+        outtmpl = os.path.join(output_path, prefix + '%(title)s.%(ext)s')
+        metrics.start = time.perf_counter()
+        video_id = video_id_of(url)
+        store_key = (video_id, self.download_sessions.params.get('format') or 'default') if video_id else None
+        while store_key is not None:
+            found = self.store.find(store_key)
+            if found is not None:
+                return self._place_stored(found, output_path, prefix, job_id, journal_key, url, entry_url, metrics)
+            flight, leader = self.store.claim(store_key)
+            if leader:
+                break
+            self.emit('log', message=f"[Job {job_id}] {video_id} is already downloading, waiting for it")
+            if job is not None:
+                # give the worker back; the job is queued again once the other download is over and then
+                # links its file (or downloads itself if that one failed)
+                return Deferred(lambda callback: self.store.follow(flight, callback))
+            flight.done.wait()
+            # the other download finished (found next round) or failed (we take over)
+        filepath = title = None
+        self.limiter.register(job_id, weight)
+        fragments = self.fragments.acquire(job_id)
+        # under a rate limit, yt-dlp's read block (which grows up to 4 MB on fast links) is pinned at 64 KB,
+        # so the limiter charges small steps instead of stalling a job for seconds after each huge read
+        limited = bool(self.limiter.rate)
+        params = {'concurrent_fragment_downloads': fragments, 'buffersize': 64 * 1024 if limited else 1024,
+                  'noresizebuffer': limited}
+        pool = self.process_pool
+        try:
+            if pool is not None:
+                if video_id:
+                    # queued before isolation was turned on: the worker process extracts by itself
+                    self.resolve_scheduler.cancel(f"resolve:{job_id}")
+                    self.resolver.discard(url)
+                outcome = pool.run(url, outtmpl, params, hook, metrics)
+                failed, filepath, title = outcome['failed'], outcome['filepath'], outcome['title']
+                video_id = outcome['video_id'] or video_id
+            else:
+                with self.download_sessions.session(outtmpl, hook, logger=metrics, params=params) as ydl:
+                    resolved = self.resolver.take(url) if video_id else None
+                    if resolved is not None:
+                        # formats were resolved ahead of time, go straight to format selection and download
+                        info = ydl.process_ie_result(resolved, download=True)
+                    else:
+                        info = ydl.extract_info(url, download=True)
+                    # ignoreerrors turns failures into None / a non-zero return code
+                    failed = info is None or ydl._download_retcode
+                    if not failed:
+                        downloads = info.get('requested_downloads') or [info]
+                        filepath = downloads[-1].get('filepath') or ydl.prepare_filename(info)
+                        video_id, title = info.get('id'), info.get('title')
+            result = {
+                'url': url,
+                'video_id': video_id,
+                'filepath': filepath,
+                'entry_url': entry_url,
+                'success': not failed,
+                'message': f"✅ [Job {job_id}] Download completed successfully!" if not failed
+                           else f"❌ [Job {job_id}] Download failed"
+                                + (f": {metrics.error_message}" if metrics.error_message else ""),
+            }
+        except Exception as e:
+            result = {
+                'url': url,
+                'success': False,
+                'message': f"❌ [Job {job_id}] Error: {str(e)}"
+            }
+        finally:
+            self.limiter.unregister(job_id)
+        metrics.downloaded()
+        self.fragments.release(job_id, metrics.bytes, metrics.end - (metrics.first_byte or metrics.start),
+                               metrics.fragments if result['success'] else 0)
+        result['download_time'] = round(metrics.download_time, 3)
+        if store_key is not None:
+            result['store_key'], result['title'] = store_key, title if result['success'] else None
+        self.emit('downloaded', job_id=job_id, url=url, success=result['success'], download_time=result['download_time'])
+        if job is not None and job.cancelled:
+            if not self._shutting_down:
+                self.journal.set_state(journal_key, "cancelled")
+            self._finish(job_id, journal_key, result, metrics, status="cancelled")
+        elif result['success'] and filepath and self.postprocess.available:
+            # the download slot is released now, conversion continues in the process pool
+            self.postprocess.submit(filepath, lambda pp, error: self._postprocessed(job_id, journal_key, result, metrics, pp, error))
+        else:
+            self._finish(job_id, journal_key, result, metrics)
+        return result
+
+    def _place_stored(self, found, output_path, prefix, job_id, journal_key, url, entry_url, metrics):
+        # the video is already on disk for another playlist: link it here instead of downloading
+        self.resolver.discard(url)
+        source, title = found
+        dest = os.path.join(output_path, prefix + yt_dlp.utils.sanitize_filename(title or "") + os.path.splitext(source)[1])
+        start = time.perf_counter()
+        try:
+            self.store.link(source, dest)
+            result = {'url': url, 'video_id': video_id_of(url), 'filepath': dest, 'entry_url': entry_url, 'success': True,
+                      'message': f"✅ [Job {job_id}] Already downloaded, linked from {source}"}
+        except OSError as e:
+            result = {'url': url, 'success': False, 'message': f"❌ [Job {job_id}] Error linking {source}: {e}"}
+        metrics.downloaded()
+        result['download_time'] = round(metrics.download_time, 3)
+        if result['success']:
+            self.emit('finished', job_id=job_id, url=url)
+        pp = {'path': dest, 'action': 'link', 'seconds': time.perf_counter() - start} if result['success'] else None
+        self._finish(job_id, journal_key, result, metrics, pp)
+        return result
+
+    def _postprocessed(self, job_id, journal_key, result, metrics, pp, error):
+        result = dict(result)
+        if isinstance(error, CancelledError):
+            result['success'] = False
+            result['message'] = f"❌ [Job {job_id}] Post-processing cancelled"
+        elif error is not None:
+            result['success'] = False
+            result['message'] = f"❌ [Job {job_id}] Post-processing error: {error}"
+        self._finish(job_id, journal_key, result, metrics, pp)
+
+    def _finish(self, job_id, journal_key, result, metrics, pp=None, status=None):
+        metrics.postprocess_time = pp['seconds'] if pp else 0.0
+        metrics.status = status or ("success" if result['success'] else "failed")
+        result = dict(result)
+        store_key, title = result.pop('store_key', None), result.pop('title', None)
+        if status is None:
+            self.journal.set_state(journal_key, "done" if result['success'] else "failed", result['message'])
+            if result['success'] and result.get('video_id'):
+                result['filepath'] = pp['path'] if pp else result.get('filepath')
+                self.archive.add(result['video_id'], result['filepath'], result.get('entry_url'))
+                if store_key is not None and result['filepath']:
+                    self.store.put(store_key, result['filepath'], title)
+        if store_key is not None:
+            self.store.release(store_key)  # lets jobs waiting on this video link it (or retry if it failed)
+        self.metrics.record(metrics)
+        self.emit('done', job_id=job_id, postprocess_time=round(metrics.postprocess_time, 3),
+                  action=pp['action'] if pp else None, metrics=metrics.to_dict(), **result)
+
+
+class QueueWorker:
+    """
+    Headless worker that pulls video jobs from a SharedJobQueue and runs them
+    on a local DownloadEngine, never holding more leases than the engine has
+    download slots. Leases are renewed every lease_time/3 seconds; a job
+    whose lease was lost (this host stalled past its lease) is cancelled
+    here, since another worker owns it now.
+    """
+    def __init__(self, engine: 'DownloadEngine', queue: SharedJobQueue, worker_id: str = None, poll: float = 1.0):
+        self.engine = engine
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll = poll
+        self.completed = 0
+        self._held = {}  # engine job id -> lease token
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        engine.subscribe(self._on_event)
+
+    def _on_event(self, event, data):
+        if event != 'done':
+            return
+        with self._lock:
+            token = self._held.pop(data.get('job_id'), None)
+        if token is not None and self.queue.complete(token, data['success'], data['message']):
+            self.completed += 1
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.queue.lease_time / 3):
+            with self._lock:
+                held = dict(self._held)
+            try:
+                kept = self.queue.heartbeat(self.worker_id, held.values())
+            except sqlite3.Error as e:
+                self.engine.emit('log', message=f"Queue heartbeat failed: {e}")
+                continue
+            for job_id, token in held.items():
+                if token not in kept:
+                    with self._lock:
+                        self._held.pop(job_id, None)
+                    self.engine.emit('log', message=f"Lease of job {job_id} was lost, cancelling it")
+                    self.engine.cancel(job_id)
+
+    def run(self, exit_when_empty: bool = False):
+        """Work until stop() is called (or, with exit_when_empty, until nothing is queued or leased)."""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    free = self.engine.scheduler.max_workers - len(self._held)
+                jobs = self.queue.lease(self.worker_id, free) if free > 0 else []
+                for job in jobs:
+                    job_id = f"queue:{job['token']}"
+                    with self._lock:
+                        self._held[job_id] = job['token']
+                    # the queue decides what is done; a local journal entry must not skip a job queued again by a sync
+                    self.engine.submit(job_id, job['url'], job['output_path'], playlist_index=job['playlist_index'],
+                                       entry_url=job['entry_url'], force=True)
+                if jobs:
+                    continue
+                if exit_when_empty and not self._held:
+                    stats = self.queue.stats()
+                    if not stats['queued'] and not stats['leased']:
+                        break
+                self._stop.wait(self.poll)
+        finally:
+            self.stop()
+            heartbeat.join()
+
+    def stop(self):
+        """Stop leasing, cancel the running jobs and hand them back to the queue."""
+        self._stop.set()
+        with self._lock:
+            held, self._held = self._held, {}
+        for job_id in held:
+            self.engine.cancel(job_id)
+        if held:
+            self.queue.release(held.values())
+
+
+def read_batch(path: str) -> list:
+    """URLs to download from a .ydl library or a text file with one URL per line."""
+    if path.lower().endswith(".ydl") or LibraryStore.is_store(path):
+        library = MediaLibrary()
+        library.open(path)
+        urls = [e.url for e in library.get_all()]
+        library.detach()
+        return urls
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def run_queue(engine: DownloadEngine, queue: SharedJobQueue, args, failures: list) -> int:
+    if args.source:
+        for url in read_batch(args.source):
+            try:
+                info = engine.fetch(url)
+            except Exception as e:
+                failures.append(url)
+                engine.emit('log', message=f"Error fetching {url}: {e}")
+                continue
+            added = queue.put_info(info, args.output, entry_url=url)
+            engine.emit('log', message=f"Queued {added} new videos of {url}")
+    else:
+        worker = QueueWorker(engine, queue)
+        engine.emit('log', message=f"Worker {worker.worker_id} pulling jobs from {args.queue}")
+        try:
+            worker.run(exit_when_empty=args.exit_when_empty)
+        except KeyboardInterrupt:
+            worker.stop()
+        engine.emit('log', message=f"Worker {worker.worker_id} completed {worker.completed} jobs")
+    engine.shutdown()
+    queue.close()
+    return 1 if failures else 0
+
+
+def run_batch(engine: DownloadEngine, args, failures: list) -> int:
+    if args.resume:
+        engine.resume_pending()
+    for n, url in enumerate(read_batch(args.source)):
+        if args.sync:
+            try:
+                engine.sync(url, args.output, id_prefix=f"{n}.")
+            except Exception as e:
+                failures.append(url)
+                engine.emit('log', message=f"Error syncing {url}: {e}")
+            continue
+        streamed = []
+        # uncached playlists are queued page by page, so the first videos download while the rest is listed
+        def submit_page(info, start, done, prefix=f"{n}."):
+            streamed.append(start)
+            engine.submit_info(info, args.output, id_prefix=prefix, start=start, entry_url=url)
+        try:
+            info = engine.fetch(url, on_page=submit_page)
+        except Exception as e:
+            failures.append(url)
+            engine.emit('log', message=f"Error fetching {url}: {e}")
+            continue
+        if not streamed:
+            engine.submit_info(info, args.output, id_prefix=f"{n}.", entry_url=url)
+    engine.wait()
+    if args.metrics:
+        engine.export_metrics(args.metrics)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download a batch of YouTube URLs without the GUI.")
+    parser.add_argument("source", nargs="?", help="text file with one URL per line, or a .ydl library")
+    parser.add_argument("-o", "--output", default=".", help="download folder (default: current folder)")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="concurrent downloads (default: 4)")
+    parser.add_argument("--per-host", type=int, default=4, help="concurrent downloads per host (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="also queue unfinished jobs from earlier runs")
+    parser.add_argument("--limit-rate", type=float, default=0, metavar="KBPS",
+                        help="total bandwidth for all downloads in KB/s (default: unlimited)")
+    parser.add_argument("--fragments", type=int, default=16, metavar="N",
+                        help="fragment connections shared by all DASH/HLS downloads (default: 16)")
+    parser.add_argument("--sync", action="store_true",
+                        help="only queue videos that are not in the download archive or are missing on disk")
+    parser.add_argument("--isolate", action="store_true",
+                        help="run each download in a worker process that is restarted if it crashes or hangs")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write job metrics when done (.prom/.txt: Prometheus text, otherwise JSON)")
+    parser.add_argument("--queue", metavar="FILE",
+                        help="shared job queue: with a source, add its videos to the queue; without, work through it")
+    parser.add_argument("--exit-when-empty", action="store_true", help="queue worker: stop once no job is left")
+    args = parser.parse_args(argv)
+    if not args.source and not args.queue:
+        parser.error("a source or --queue is required")
+
+    engine = DownloadEngine(max_workers=args.workers, per_host_limit=args.per_host, rate_limit=args.limit_rate * 1024,
+                            fragment_cap=args.fragments, isolate=args.isolate)
+    out_lock = threading.Lock()
+    failures = []
+
+    def print_event(event, data):
+        if event == 'done' and not data['success']:
+            failures.append(data['url'])
+        with out_lock:
+            print(json.dumps({'event': event, 'time': round(time.time(), 3), **data}, ensure_ascii=False), flush=True)
+
+    engine.subscribe(print_event)
+    if args.queue:
+        return run_queue(engine, SharedJobQueue(args.queue), args, failures)
+    try:
+        return run_batch(engine, args, failures)
+    finally:
+        engine.shutdown()  # stops worker processes and the post-process pool
+
+
+if __name__ == '__main__':
+    sys.exit(main())